@@ -4,4 +4,4 @@ default_app_config = 'django_tus.apps.DjangoTusConfig'
 
 tus_api_version = '1.0.0'
 tus_api_version_supported = ['1.0.0', ]
-tus_api_extensions = ['creation', 'termination', 'file-check']
+tus_api_extensions = ['creation', 'creation-with-upload', 'creation-defer-length', 'termination', 'file-check', 'concatenation', 'checksum', 'expiration']
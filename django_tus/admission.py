@@ -0,0 +1,64 @@
+import hashlib
+import socket
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from django_tus.counters import ExpiringCounter
+
+
+def get_client_key(request) -> str:
+    """
+    Returns the key uploads are limited per client by: the result of the
+    function configured with `TUS_CLIENT_KEY`, or the remote address.
+    """
+    if settings.TUS_CLIENT_KEY:
+        return import_string(settings.TUS_CLIENT_KEY)(request)
+    return request.META.get('REMOTE_ADDR', '')
+
+
+class ActiveUploads:
+    """
+    Caps the number of uploads in progress per node, with
+    `TUS_MAX_ACTIVE_UPLOADS_PER_NODE`, and per client, with
+    `TUS_MAX_ACTIVE_UPLOADS_PER_CLIENT`.
+
+    `acquire` returns the counters an upload was counted in, which are kept
+    in its state, so that `release` takes it back from the same counters
+    wherever the upload ends.
+    """
+
+    @staticmethod
+    def counters(client_key: str) -> list:
+        counters = []
+        if settings.TUS_MAX_ACTIVE_UPLOADS_PER_NODE:
+            counters.append(('tus-active/node/{}'.format(socket.gethostname()),
+                             settings.TUS_MAX_ACTIVE_UPLOADS_PER_NODE))
+        if settings.TUS_MAX_ACTIVE_UPLOADS_PER_CLIENT:
+            digest = hashlib.md5(client_key.encode()).hexdigest()
+            counters.append(('tus-active/client/{}'.format(digest), settings.TUS_MAX_ACTIVE_UPLOADS_PER_CLIENT))
+        return counters
+
+    def acquire(self, client_key: str, expires: float, count: int = 1):
+        """
+        Counts `count` new uploads, returning the names of the counters they
+        were counted in, or `None` if that exceeds a limit.
+        """
+        acquired = []
+        for name, limit in self.counters(client_key):
+            counter = ExpiringCounter(name)
+            counter.incr(expires, count)
+            acquired.append(name)
+            # Counting first makes concurrent requests see each other.
+            if counter.value() > limit:
+                self.release(acquired, expires, count)
+                return None
+        return tuple(acquired)
+
+    @staticmethod
+    def release(names, expires: float, count: int = 1):
+        for name in names or ():
+            ExpiringCounter(name).decr(expires, count)
+
+
+active_uploads = ActiveUploads()
@@ -1,10 +1,19 @@
+import os
 from pathlib import Path
 
 from django.apps import AppConfig
 
 from django_tus.conf import settings
+from django_tus.dedup import DEDUPLICATION_DIGEST, DEDUPLICATION_MODES
+from django_tus.durability import DURABILITY_MODES
+from django_tus.errors import BAD_CONFIG_ERROR_TUS_DEDUPLICATE
 from django_tus.errors import BAD_CONFIG_ERROR_TUS_DESTINATION_DIR
+from django_tus.errors import BAD_CONFIG_ERROR_TUS_DURABILITY
+from django_tus.errors import BAD_CONFIG_ERROR_TUS_PREALLOCATION
 from django_tus.errors import BAD_CONFIG_ERROR_TUS_UPLOAD_DIR
+from django_tus.errors import DIFFERENT_FILESYSTEMS_WARNING
+from django_tus.fileutils import same_filesystem
+from django_tus.space import PREALLOCATION_MODES
 
 
 def django_tus_config_check(app_configs, **kwargs):
@@ -21,6 +30,23 @@ def django_tus_config_check(app_configs, **kwargs):
     if not getattr(settings, 'TUS_DESTINATION_DIR', ''):
         errors.append(BAD_CONFIG_ERROR_TUS_DESTINATION_DIR)
 
+    if getattr(settings, 'TUS_DURABILITY', 'none') not in DURABILITY_MODES:
+        errors.append(BAD_CONFIG_ERROR_TUS_DURABILITY)
+
+    if getattr(settings, 'TUS_PREALLOCATION', 'sparse') not in PREALLOCATION_MODES:
+        errors.append(BAD_CONFIG_ERROR_TUS_PREALLOCATION)
+
+    deduplicate = getattr(settings, 'TUS_DEDUPLICATE', None)
+    if deduplicate not in DEDUPLICATION_MODES or \
+            deduplicate and getattr(settings, 'TUS_UPLOAD_DIGEST', None) != DEDUPLICATION_DIGEST:
+        errors.append(BAD_CONFIG_ERROR_TUS_DEDUPLICATE)
+
+    upload_dir = getattr(settings, 'TUS_UPLOAD_DIR', '')
+    destination_dir = getattr(settings, 'TUS_DESTINATION_DIR', '')
+    if os.path.isdir(upload_dir) and os.path.isdir(destination_dir) \
+            and not same_filesystem(upload_dir, destination_dir):
+        errors.append(DIFFERENT_FILESYSTEMS_WARNING)
+
     return errors
 
 
@@ -35,3 +61,7 @@ class DjangoTusConfig(AppConfig):
         Path(settings.TUS_DESTINATION_DIR).mkdir(parents=True, exist_ok=True)
         Path(settings.TUS_UPLOAD_DIR).mkdir(parents=True, exist_ok=True)
 
+        if settings.TUS_RECOVER_ON_STARTUP:
+            from django_tus.maintenance import recover_uploads
+            recover_uploads()
+
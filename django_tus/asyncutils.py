@@ -0,0 +1,40 @@
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    The bounded thread pool, of `TUS_ASYNC_WORKERS` threads, running the
+    blocking file I/O of the async views.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.TUS_ASYNC_WORKERS)
+        return _executor
+
+
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(get_executor(), functools.partial(func, *args, **kwargs))
+
+
+async def acache(method: str, *args):
+    """
+    Calls the async variant of a cache method (`aget_many` for `get_many`),
+    which Django provides since 4.0, and falls back to running the sync method
+    in a thread.
+    """
+    async_method = getattr(cache, 'a' + method, None)
+    if async_method is not None:
+        return await async_method(*args)
+    return await sync_to_async(getattr(cache, method), thread_sensitive=False)(*args)
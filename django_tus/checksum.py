@@ -0,0 +1,103 @@
+import base64
+import binascii
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+
+class Crc32:
+    """
+    A `hashlib` compatible wrapper around `zlib.crc32`.
+    """
+    name = 'crc32'
+    digest_size = 4
+
+    def __init__(self, data: bytes = b'', value: int = 0):
+        self.value = zlib.crc32(data, value)
+
+    def update(self, data: bytes):
+        self.value = zlib.crc32(data, self.value)
+
+    def copy(self):
+        return Crc32(value=self.value)
+
+    def digest(self) -> bytes:
+        return self.value.to_bytes(self.digest_size, 'big')
+
+    def hexdigest(self) -> str:
+        return binascii.hexlify(self.digest()).decode()
+
+
+CHECKSUM_ALGORITHMS = OrderedDict((
+    ('sha1', hashlib.sha1),
+    ('sha256', hashlib.sha256),
+    ('md5', hashlib.md5),
+    ('crc32', Crc32),
+))
+
+
+def new_hash(algorithm: str):
+    return CHECKSUM_ALGORITHMS[algorithm]()
+
+
+def parse_checksum_header(value: str):
+    """
+    Parses an `Upload-Checksum` header into the algorithm name and the expected
+    digest. Raises `ValueError` for malformed headers and unsupported
+    algorithms.
+    """
+    algorithm, _, checksum = value.strip().partition(' ')
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise ValueError("Unsupported checksum algorithm: {}".format(algorithm))
+    try:
+        return algorithm, base64.b64decode(checksum, validate=True)
+    except binascii.Error:
+        raise ValueError("Malformed checksum: {}".format(checksum))
+
+
+def hash_file(path: str, algorithm: str, buffer_size: int = 1024 * 1024) -> str:
+    file_hash = new_hash(algorithm)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(buffer_size), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class UploadDigests:
+    """
+    Running whole-file digests of the uploads written by this process.
+
+    Hash objects can't be shared between processes, so a digest is only
+    continued when the next chunk of an upload is written by the same process.
+    Otherwise it is dropped and the finished file is hashed once from disk.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._digests = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, resource_id: str, offset: int, algorithm: str):
+        """
+        Returns the digest of the first `offset` bytes of the upload, or `None`
+        if this process doesn't know it.
+        """
+        if offset == 0:
+            return new_hash(algorithm)
+        with self._lock:
+            digest_offset, digest = self._digests.pop(resource_id, (None, None))
+        return digest if digest_offset == offset else None
+
+    def set(self, resource_id: str, offset: int, digest):
+        with self._lock:
+            self._digests[resource_id] = (offset, digest)
+            while len(self._digests) > self.max_size:
+                self._digests.popitem(last=False)
+
+    def discard(self, resource_id: str):
+        with self._lock:
+            self._digests.pop(resource_id, None)
+
+
+upload_digests = UploadDigests()
@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from django_tus.locks import UploadLock
+from django_tus.state import get_state_store
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+FINALIZED = 'finalized'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class UploadLocked(Exception):
+    pass
+
+
+def acquire_lock(resource_id: str, timeout: float = 5) -> UploadLock:
+    # The PATCH request submitting the completion may still hold the lock.
+    lock = UploadLock(resource_id)
+    deadline = time.monotonic() + timeout
+    while not lock.acquire():
+        if time.monotonic() > deadline:
+            raise UploadLocked(resource_id)
+        time.sleep(0.01)
+    return lock
+
+
+def complete_upload(resource_id: str, view_class):
+    """
+    Runs the completion of a finished upload: moves it to its destination,
+    then sends `tus_upload_finished_signal` and calls `on_finish` of a new
+    `view_class` instance.
+
+    The progress is kept in the `completion` of the upload state, so that a
+    retry picks up after the last step which succeeded. The state itself is
+    kept until it expires, for clients polling the status.
+    """
+    from django_tus.tusfile import TusFile
+
+    lock = acquire_lock(resource_id)
+    try:
+        state = get_state_store().get(resource_id)
+        if state is None or state.completion == DONE:
+            # Terminated, or completed by an earlier attempt.
+            return
+
+        tus_file = TusFile(resource_id, state)
+        if tus_file.completion != FINALIZED:
+            tus_file.rename(progress=lambda copied, total: lock.renew())
+            tus_file.completion = FINALIZED
+            tus_file.save_state()
+
+        view = view_class()
+        view.send_signal(tus_file)
+        view.finished()
+
+        tus_file.completion = DONE
+        tus_file.save_state()
+    finally:
+        lock.release()
+
+
+def fail_upload(resource_id: str):
+    from django_tus.tusfile import TusFile
+
+    state = get_state_store().get(resource_id)
+    if state is not None:
+        tus_file = TusFile(resource_id, state)
+        tus_file.completion = FAILED
+        tus_file.save_state()
+
+
+class CompletionBackend:
+    """
+    Runs `complete_upload` for uploads finished by a PATCH request, after
+    the request has returned. A backend for a task queue would enqueue
+    `complete_upload` with the resource id and view class.
+    """
+
+    def submit(self, resource_id: str, view_class):
+        raise NotImplementedError
+
+
+class ThreadPoolCompletionBackend(CompletionBackend):
+    """
+    Runs the completions in a bounded pool of `TUS_COMPLETION_WORKERS`
+    threads, retrying failed ones up to `TUS_COMPLETION_RETRIES` times with
+    an exponential backoff starting at `TUS_COMPLETION_RETRY_DELAY` seconds.
+
+    Completions still queued when the process exits are lost; run a task
+    queue with its own backend where this matters.
+    """
+
+    def __init__(self, max_workers: int = None, retries: int = None, retry_delay: float = None):
+        self.max_workers = max_workers or settings.TUS_COMPLETION_WORKERS
+        self.retries = retries if retries is not None else settings.TUS_COMPLETION_RETRIES
+        self.retry_delay = retry_delay if retry_delay is not None else settings.TUS_COMPLETION_RETRY_DELAY
+        self.executor = None
+        self.lock = threading.Lock()
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self.executor
+
+    def submit(self, resource_id: str, view_class):
+        return self.get_executor().submit(self.run, resource_id, view_class)
+
+    def run(self, resource_id: str, view_class):
+        for attempt in range(self.retries + 1):
+            try:
+                return complete_upload(resource_id, view_class)
+            except Exception:
+                if attempt == self.retries:
+                    logger.exception("Completion of upload %s failed", resource_id)
+                    fail_upload(resource_id)
+                    return
+                logger.warning("Completion of upload %s failed, retrying", resource_id, exc_info=True)
+                time.sleep(self.retry_delay * 2 ** attempt)
+
+
+_completion_backends = {}
+
+
+def get_completion_backend():
+    """
+    Returns the completion backend configured with `TUS_COMPLETION_BACKEND`,
+    or `None` if uploads are completed within the PATCH request.
+    """
+    backend_class = settings.TUS_COMPLETION_BACKEND
+    if not backend_class:
+        return None
+    if backend_class not in _completion_backends:
+        _completion_backends[backend_class] = import_string(backend_class)()
+    return _completion_backends[backend_class]
@@ -13,11 +13,43 @@ class DjangoTusAppConf(AppConf):
 
     UPLOAD_URL = '/media'
     MAX_FILE_SIZE = 4294967296  # in bytes, default is 4 GB
+    MIN_FILE_SIZE = 0  # in bytes
+    MAX_ACTIVE_UPLOADS_PER_NODE = None  # uploads in progress created through one host, unlimited by default
+    MAX_ACTIVE_UPLOADS_PER_CLIENT = None
+    CLIENT_KEY = None  # dotted path of a function returning the client key of a request, the remote address by default
     TIMEOUT = 3600  # in seconds
     UPLOAD_DIR = ''
     FILE_NAME_FORMAT = 'increment'
     EXISTING_FILE = 'error'
     DESTINATION_DIR = ''
+    UPLOAD_SHARD_DEPTH = 0  # number of nested directories partial uploads are sharded into, 0 for a flat directory
+    DESTINATION_SHARD_DEPTH = 0  # same for finished uploads
+    STORAGE = 'django_tus.storage.FileSystemUploadStorage'
+    PREALLOCATION = 'sparse'  # or 'posix_fallocate' to allocate the space of uploads up front, 'none' to append only
+    STATE_STORE = 'django_tus.state.CacheStateStore'  # or 'django_tus.state.JournaledStateStore'
+    FD_POOL_SIZE = 128  # number of partial upload file descriptors kept open per process
+    FD_POOL_IDLE_TIMEOUT = 30  # in seconds
+    DURABILITY = 'none'  # or 'fdatasync-per-chunk', 'fsync-on-finish', 'group-commit'
+    GROUP_COMMIT_WINDOW = 0.005  # in seconds, how long 'group-commit' waits for other writers
+    RECOVER_ON_STARTUP = False  # reconcile the offsets of partial uploads when the app is loaded
+    S3_BUCKET = ''
+    S3_PREFIX = ''
+    S3_ENDPOINT_URL = None  # for S3 compatible stores other than AWS
+    S3_PART_SIZE = 8388608  # in bytes, at least 5 MB
+    LOCK_TIMEOUT = 60  # in seconds, lease of the lock held while writing a chunk
+    CHUNK_BUFFER_SIZE = 65536  # in bytes, size of the blocks read from a PATCH body
+    BANDWIDTH_LIMIT = None  # in bytes per second, of all the uploads of a process
+    UPLOAD_BANDWIDTH_LIMIT = None  # in bytes per second, of every upload
+    CLIENT_BANDWIDTH_LIMIT = None  # in bytes per second, of the uploads of every client in a process
+    ASYNC_WORKERS = 32  # number of threads running the file I/O of AsyncTusUpload
+    COMPLETION_BACKEND = None  # e.g. 'django_tus.completion.ThreadPoolCompletionBackend' to finish uploads after the last PATCH returned
+    COMPLETION_WORKERS = 4  # number of threads of ThreadPoolCompletionBackend
+    COMPLETION_RETRIES = 3
+    COMPLETION_RETRY_DELAY = 1  # in seconds, doubled after every retry
+    BULK_MAX_UPLOADS = 1000  # maximum number of uploads in a request to TusUploadStatus or TusBatchUpload
+    UPLOAD_DIGEST = None  # one of 'sha1', 'sha256', 'md5', 'crc32' to compute a digest of every finished upload
+    DEDUPLICATE = None  # 'hardlink' or 'reflink' to link duplicates of earlier uploads, requires UPLOAD_DIGEST = 'sha256'
+    DEDUP_TIMEOUT = 604800  # in seconds, how long the digests of finished uploads are kept to find their duplicates
 
     def configure_upload_dir(self, value):
 
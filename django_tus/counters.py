@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class ExpiringCounter:
+    """
+    A counter of things belonging to uploads in progress, shared by all
+    workers through the cache.
+
+    Amounts are counted per period of `TUS_TIMEOUT` in which their upload
+    expires, so what is never taken back, e.g. for abandoned uploads, simply
+    expires along with its upload.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def key(self, period: int) -> str:
+        return "{}/{}".format(self.name, period)
+
+    @staticmethod
+    def period(expires: float) -> int:
+        return int(expires // settings.TUS_TIMEOUT)
+
+    def incr(self, expires: float, amount: int = 1):
+        if amount <= 0:
+            return
+        period = self.period(expires)
+        key = self.key(period)
+        ttl = max(1, int((period + 1) * settings.TUS_TIMEOUT - time.time()) + 1)
+        cache.add(key, 0, ttl)
+        try:
+            cache.incr(key, amount)
+        except ValueError:
+            # Evicted in between, recreate it.
+            cache.add(key, amount, ttl)
+
+    def decr(self, expires: float, amount: int = 1):
+        if amount <= 0:
+            return
+        try:
+            cache.decr(self.key(self.period(expires)), amount)
+        except ValueError:
+            pass
+
+    def value(self, now: float = None) -> int:
+        # Uploads in progress expire within the current period or the next.
+        period = self.period(now if now is not None else time.time())
+        values = cache.get_many([self.key(period), self.key(period + 1)])
+        return sum(max(0, value) for value in values.values())
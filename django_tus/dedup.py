@@ -0,0 +1,57 @@
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+
+DEDUPLICATION_MODES = (None, 'hardlink', 'reflink')
+
+# Only digests which can't be forged make a file a duplicate of another.
+DEDUPLICATION_DIGEST = 'sha256'
+
+
+def deduplicates() -> bool:
+    return bool(settings.TUS_DEDUPLICATE) and settings.TUS_UPLOAD_DIGEST == DEDUPLICATION_DIGEST
+
+
+class DigestIndex:
+    """
+    Maps the digests of finished uploads to their filename, relative to
+    `TUS_DESTINATION_DIR`, through the cache.
+
+    The index is a hint: entries evicted from the cache, or expired after
+    `TUS_DEDUP_TIMEOUT` seconds, only cost a copy. Entries also record the
+    device, inode, modification time and size of the file, those whose file
+    was deleted or changed since are ignored.
+    """
+
+    @staticmethod
+    def key(digest: str) -> str:
+        return "tus-digests/{}/{}".format(DEDUPLICATION_DIGEST, digest)
+
+    @staticmethod
+    def identity(filename: str) -> tuple:
+        stat = os.stat(os.path.join(settings.TUS_DESTINATION_DIR, filename))
+        return stat.st_dev, stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def find(self, digest: str, file_size: int):
+        """
+        Returns the filename of a finished upload with the given digest and
+        size, or `None`.
+        """
+        entry = cache.get(self.key(digest))
+        if entry is None:
+            return None
+        filename, identity = entry
+        try:
+            if identity[3] == file_size and self.identity(filename) == identity:
+                return filename
+        except OSError:
+            pass
+        cache.delete(self.key(digest))
+        return None
+
+    def add(self, digest: str, filename: str):
+        cache.set(self.key(digest), (filename, self.identity(filename)), settings.TUS_DEDUP_TIMEOUT)
+
+
+digest_index = DigestIndex()
@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+
+DURABILITY_MODES = ('none', 'fdatasync-per-chunk', 'fsync-on-finish', 'group-commit')
+
+fdatasync = getattr(os, 'fdatasync', os.fsync)
+
+
+class _Batch:
+    __slots__ = ('fds', 'errors', 'done')
+
+    def __init__(self):
+        self.fds = []
+        self.errors = {}
+        self.done = False
+
+
+class GroupCommitter:
+    """
+    Batches the syncs of concurrent writers within this process. The first
+    writer asking for a sync waits `window` seconds for others to join, then
+    syncs all their files back to back, which lets the filesystem commit them
+    in a single journal transaction.
+    """
+
+    def __init__(self, window: float = None):
+        self.window = window
+        self._condition = threading.Condition()
+        self._batch = _Batch()
+
+    def sync(self, fd: int):
+        with self._condition:
+            batch = self._batch
+            batch.fds.append(fd)
+            leader = len(batch.fds) == 1
+
+        if leader:
+            time.sleep(self.window if self.window is not None else settings.TUS_GROUP_COMMIT_WINDOW)
+            with self._condition:
+                self._batch = _Batch()
+            for batch_fd in batch.fds:
+                try:
+                    fdatasync(batch_fd)
+                except OSError as e:
+                    batch.errors[batch_fd] = e
+            with self._condition:
+                batch.done = True
+                self._condition.notify_all()
+        else:
+            with self._condition:
+                while not batch.done:
+                    self._condition.wait()
+
+        if fd in batch.errors:
+            raise batch.errors[fd]
+
+
+group_committer = GroupCommitter()
+
+
+def sync_chunk(fd: int):
+    """
+    Makes a written chunk durable according to `TUS_DURABILITY`.
+    """
+    durability = settings.TUS_DURABILITY
+    if durability == 'fdatasync-per-chunk':
+        fdatasync(fd)
+    elif durability == 'group-commit':
+        group_committer.sync(fd)
+
+
+def sync_finished_file(path: str):
+    """
+    Makes a finished upload durable before it's moved to its destination.
+    Chunks synced one by one are durable already.
+    """
+    if settings.TUS_DURABILITY == 'fsync-on-finish':
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def syncs_copies() -> bool:
+    """
+    Whether files copied from uploads, e.g. across filesystems or when
+    concatenating, are synced before their sources are deleted. Whatever the
+    `TUS_DURABILITY`, they are the only copy left once they are.
+    """
+    return settings.TUS_DURABILITY != 'none'
+
+
+def sync_directory(path: str):
+    """
+    Makes the creation or renaming of files in a directory durable.
+    """
+    if settings.TUS_DURABILITY == 'none' or not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
@@ -1,4 +1,4 @@
-from django.core.checks import Error
+from django.core.checks import Error, Warning
 
 
 BAD_CONFIG_ERROR_TUS_UPLOAD_DIR = Error(
@@ -15,3 +15,36 @@ BAD_CONFIG_ERROR_TUS_DESTINATION_DIR = Error(
     obj='django.conf.settings.TUS_DESTINATION_DIR',
     id='django-tus.E002',
 )
+
+
+BAD_CONFIG_ERROR_TUS_DURABILITY = Error(
+    'Error while checking the configuration for "django-tus',
+    hint="TUS_DURABILITY must be one of 'none', 'fdatasync-per-chunk', 'fsync-on-finish', 'group-commit'",
+    obj='django.conf.settings.TUS_DURABILITY',
+    id='django-tus.E003',
+)
+
+
+BAD_CONFIG_ERROR_TUS_PREALLOCATION = Error(
+    'Error while checking the configuration for "django-tus',
+    hint="TUS_PREALLOCATION must be one of 'sparse', 'posix_fallocate', 'none'",
+    obj='django.conf.settings.TUS_PREALLOCATION',
+    id='django-tus.E004',
+)
+
+
+BAD_CONFIG_ERROR_TUS_DEDUPLICATE = Error(
+    'Error while checking the configuration for "django-tus',
+    hint="TUS_DEDUPLICATE must be None, 'hardlink' or 'reflink', and requires TUS_UPLOAD_DIGEST = 'sha256'",
+    obj='django.conf.settings.TUS_DEDUPLICATE',
+    id='django-tus.E005',
+)
+
+
+DIFFERENT_FILESYSTEMS_WARNING = Warning(
+    'TUS_UPLOAD_DIR and TUS_DESTINATION_DIR are on different filesystems',
+    hint='Finished uploads will be copied instead of renamed. Put both directories on the same filesystem to make '
+         'finishing an upload instant.',
+    obj='django.conf.settings.TUS_DESTINATION_DIR',
+    id='django-tus.W001',
+)
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class _Entry:
+    __slots__ = ('fd', 'users', 'last_used', 'evicted')
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self.users = 0
+        self.last_used = time.monotonic()
+        self.evicted = False
+
+
+class FileDescriptorPool:
+    """
+    A bounded, per-process LRU cache of file descriptors of partial uploads,
+    so consecutive chunks of an upload don't each pay for open and close.
+
+    Descriptors are only used with `os.pwrite`, so no file position is shared
+    between requests. They are closed when the pool is full, after
+    `TUS_FD_POOL_IDLE_TIMEOUT` seconds without use, and when their upload is
+    finished or terminated in this process. Idle descriptors are looked for
+    whenever one is acquired or released, and by a background thread while
+    the pool isn't empty, so they don't outlive a worker going idle.
+    """
+
+    def __init__(self, max_size: int = None, idle_timeout: float = None):
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._sweeper = None
+
+    @property
+    def max_size(self) -> int:
+        return self._max_size if self._max_size is not None else settings.TUS_FD_POOL_SIZE
+
+    @property
+    def idle_timeout(self) -> float:
+        return self._idle_timeout if self._idle_timeout is not None else settings.TUS_FD_POOL_IDLE_TIMEOUT
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._check_pid()
+            return key in self._entries
+
+    def acquire(self, key: str, path: str) -> int:
+        with self._lock:
+            self._check_pid()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                entry.users += 1
+                return entry.fd
+
+        fd = os.open(path, os.O_WRONLY)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Opened concurrently by another thread, use theirs.
+                entry.users += 1
+                to_close = [fd]
+            else:
+                entry = self._entries[key] = _Entry(fd)
+                entry.users += 1
+                to_close = self._evict_expired()
+                self._start_sweeper()
+        self._close(to_close)
+        return entry.fd
+
+    def release(self, key: str):
+        to_close = []
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+            if entry.evicted and not entry.users:
+                del self._entries[key]
+                to_close.append(entry.fd)
+            to_close.extend(self._evict_expired())
+        self._close(to_close)
+
+    def evict(self, key: str):
+        """
+        Closes the descriptor of an upload, as soon as no request uses it.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if entry.users:
+                entry.evicted = True
+                return
+            del self._entries[key]
+        self._close([entry.fd])
+
+    def evict_idle(self):
+        """
+        Closes the descriptors unused for `TUS_FD_POOL_IDLE_TIMEOUT` seconds,
+        and the least recently used ones beyond `TUS_FD_POOL_SIZE`.
+        """
+        with self._lock:
+            self._check_pid()
+            to_close = self._evict_expired()
+        self._close(to_close)
+
+    def _evict_expired(self) -> list:
+        now = time.monotonic()
+        fds = []
+        for key, entry in list(self._entries.items()):
+            if entry.users:
+                continue
+            if len(self._entries) > self.max_size or now - entry.last_used > self.idle_timeout:
+                del self._entries[key]
+                fds.append(entry.fd)
+        return fds
+
+    def _start_sweeper(self):
+        if self._sweeper is None:
+            self._sweeper = threading.Thread(target=self._sweep, name='tus-fd-pool', daemon=True)
+            self._sweeper.start()
+
+    def _sweep(self):
+        while True:
+            time.sleep(max(self.idle_timeout, 1))
+            self.evict_idle()
+            with self._lock:
+                if not self._entries:
+                    self._sweeper = None
+                    return
+
+    def _check_pid(self):
+        # Descriptors inherited from a parent process are not ours to reuse,
+        # and neither is its sweeper thread.
+        if self._pid != os.getpid():
+            self._entries = OrderedDict()
+            self._pid = os.getpid()
+            self._sweeper = None
+
+    @staticmethod
+    def _close(fds):
+        for fd in fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+fd_pool = FileDescriptorPool()
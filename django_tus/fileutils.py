@@ -0,0 +1,135 @@
+import errno
+import os
+
+COPY_BLOCK_SIZE = 8 * 1024 * 1024  # in bytes, amount copied between two progress callbacks
+
+# Errors raised by the kernel copy functions when they don't support the given
+# files (e.g. copy_file_range across filesystems on older kernels).
+_UNSUPPORTED_ERRNOS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP)
+
+
+def same_filesystem(*paths) -> bool:
+    return len({os.stat(path).st_dev for path in paths}) == 1
+
+
+def _copy_file_range(src_fd, dst_fd, count, src_offset, dst_offset):
+    return os.copy_file_range(src_fd, dst_fd, count, src_offset, dst_offset)
+
+
+def _sendfile(src_fd, dst_fd, count, src_offset, dst_offset):
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, src_offset, count)
+
+
+def _read_write(src_fd, dst_fd, count, src_offset, dst_offset):
+    os.lseek(src_fd, src_offset, os.SEEK_SET)
+    os.lseek(dst_fd, dst_offset, os.SEEK_SET)
+    return os.write(dst_fd, os.read(src_fd, count))
+
+
+def _copy_strategies():
+    if hasattr(os, 'copy_file_range'):
+        yield _copy_file_range
+    if hasattr(os, 'sendfile'):
+        yield _sendfile
+    yield _read_write
+
+
+def copy_range(src_fd: int, dst_fd: int, count: int, src_offset: int = 0, dst_offset: int = 0, progress=None) -> int:
+    """
+    Copies `count` bytes between two file descriptors, inside the kernel when
+    possible: `copy_file_range` first, then `sendfile`, then a plain read/write
+    loop.
+
+    `progress` is called with the number of bytes copied so far and `count`
+    after every block; raising from it cancels the copy.
+    """
+    strategies = _copy_strategies()
+    strategy = next(strategies)
+    copied = 0
+    while copied < count:
+        length = min(COPY_BLOCK_SIZE, count - copied)
+        try:
+            copied_now = strategy(src_fd, dst_fd, length, src_offset + copied, dst_offset + copied)
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRNOS or strategy is _read_write:
+                raise
+            strategy = next(strategies)
+            continue
+        if not copied_now:
+            raise IOError("Unexpected end of file after {} of {} bytes".format(copied, count))
+        copied += copied_now
+        if progress is not None:
+            progress(copied, count)
+    return copied
+
+
+def copy_file(src_path: str, dst_path: str, progress=None, sync: bool = False):
+    src_fd = os.open(src_path, os.O_RDONLY)
+    try:
+        dst_fd = os.open(dst_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            copy_range(src_fd, dst_fd, os.fstat(src_fd).st_size, progress=progress)
+            if sync:
+                os.fsync(dst_fd)
+        finally:
+            os.close(dst_fd)
+    finally:
+        os.close(src_fd)
+
+
+def move_file(src_path: str, dst_path: str, progress=None, sync: bool = False):
+    """
+    Moves a file with an atomic rename when source and destination share a
+    filesystem. Otherwise the file is copied next to the destination with
+    `copy_range` and renamed into place, so a partially copied file never
+    shows up under the destination name. With `sync`, the copy is fsync'ed
+    before it is renamed and the source deleted.
+    """
+    if same_filesystem(src_path, os.path.dirname(dst_path) or '.'):
+        os.replace(src_path, dst_path)
+        return
+
+    tmp_path = '{}.{}.tmp'.format(dst_path, os.getpid())
+    try:
+        copy_file(src_path, tmp_path, progress=progress, sync=sync)
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.remove(src_path)
+
+
+FICLONE = 0x40049409  # ioctl cloning a whole file on Linux (btrfs, XFS, ...)
+
+# Errors raised when a filesystem can't link or clone the given files.
+_UNLINKABLE_ERRNOS = _UNSUPPORTED_ERRNOS + (errno.EPERM, errno.EMLINK, errno.ENOTTY)
+
+
+def _reflink(src_path: str, dst_path: str):
+    import fcntl
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def link_file(src_path: str, dst_path: str, mode: str = 'hardlink') -> bool:
+    """
+    Makes `dst_path` share the contents of `src_path`, as a hard link or, with
+    `mode='reflink'`, as a copy-on-write clone, replacing `dst_path` if it
+    exists. Returns `False` if the filesystem doesn't support it.
+    """
+    tmp_path = '{}.{}.tmp'.format(dst_path, os.getpid())
+    try:
+        if mode == 'reflink':
+            _reflink(src_path, tmp_path)
+        else:
+            os.link(src_path, tmp_path)
+        os.replace(tmp_path, dst_path)
+    except (ImportError, OSError) as e:
+        if os.path.lexists(tmp_path):
+            os.remove(tmp_path)
+        if isinstance(e, ImportError) or e.errno in _UNLINKABLE_ERRNOS:
+            return False
+        raise
+    return True
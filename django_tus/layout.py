@@ -0,0 +1,62 @@
+import hashlib
+import os
+
+from django.conf import settings
+
+
+def shard_dirs(key: str, depth: int) -> list:
+    """
+    Returns the names of the nested shard directories for `key`, two
+    characters per level: `['ab', 'cd']` for `'abcdef...'` and depth 2.
+    """
+    return [key[2 * level:2 * level + 2] for level in range(depth)]
+
+
+def upload_path(resource_id: str) -> str:
+    """
+    Returns the path of the partial file of an upload, sharded by its
+    resource id if `TUS_UPLOAD_SHARD_DEPTH` is set. Sidecar files go next to
+    it.
+    """
+    shards = shard_dirs(resource_id.replace('-', ''), settings.TUS_UPLOAD_SHARD_DEPTH)
+    return os.path.join(settings.TUS_UPLOAD_DIR, *shards, resource_id)
+
+
+def destination_subdir(filename: str) -> str:
+    """
+    Returns the directory, relative to `TUS_DESTINATION_DIR`, finished
+    uploads named `filename` go to, sharded by a hash of the name if
+    `TUS_DESTINATION_SHARD_DEPTH` is set. All the names generated from
+    `filename` share it.
+    """
+    depth = settings.TUS_DESTINATION_SHARD_DEPTH
+    if not depth:
+        return ''
+    return os.path.join(*shard_dirs(hashlib.md5(filename.encode()).hexdigest(), depth))
+
+
+def destination_path(filename: str) -> str:
+    return os.path.join(settings.TUS_DESTINATION_DIR, destination_subdir(filename), filename)
+
+
+def make_parent_dirs(path: str):
+    parent = os.path.dirname(path)
+    if not os.path.isdir(parent):
+        os.makedirs(parent, exist_ok=True)
+
+
+def walk_files(directory: str):
+    """
+    Yields the `os.DirEntry` of every file below `directory`, whatever the
+    shard depth. Hidden files and directories are skipped.
+    """
+    directories = [directory]
+    while directories:
+        with os.scandir(directories.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file():
+                    yield entry
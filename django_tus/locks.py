@@ -0,0 +1,78 @@
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from django_tus.asyncutils import acache
+
+
+class LockLost(Exception):
+    """
+    Raised when a lock expired and was taken by another request.
+    """
+
+
+class UploadLock:
+    """
+    A lease on an upload, shared by all workers through the cache.
+
+    The lock is taken with the atomic `cache.add`, so exactly one request can
+    hold it at a time. It expires after `TUS_LOCK_TIMEOUT` seconds, which lets
+    uploads recover from crashed workers; long running requests keep it alive
+    with `renew`.
+    """
+
+    def __init__(self, resource_id: str, timeout: int = None):
+        self.resource_id = resource_id
+        self.timeout = timeout or settings.TUS_LOCK_TIMEOUT
+        self.token = uuid.uuid4().hex
+        self.acquired = False
+        self.renewed_at = None
+
+    @property
+    def key(self) -> str:
+        return "tus-uploads/{}/lock".format(self.resource_id)
+
+    def acquire(self) -> bool:
+        self.acquired = cache.add(self.key, self.token, self.timeout)
+        self.renewed_at = time.monotonic()
+        return self.acquired
+
+    async def aacquire(self) -> bool:
+        self.acquired = await acache('add', self.key, self.token, self.timeout)
+        self.renewed_at = time.monotonic()
+        return self.acquired
+
+    def is_held(self) -> bool:
+        return self.acquired and cache.get(self.key) == self.token
+
+    def renew(self):
+        """
+        Extends the lease, at most once per half lease period. Raises
+        `LockLost` if the lease expired and another request took the lock.
+        """
+        if self.acquired and time.monotonic() - self.renewed_at > self.timeout / 2:
+            if not self.is_held():
+                raise LockLost(self.resource_id)
+            cache.touch(self.key, self.timeout)
+            self.renewed_at = time.monotonic()
+
+    def release(self):
+        # Only delete the lock if it is still ours; it may have expired and been
+        # taken by another request in the meantime.
+        if self.acquired and cache.get(self.key) == self.token:
+            cache.delete(self.key)
+        self.acquired = False
+
+    async def arelease(self):
+        if self.acquired and await acache('get', self.key) == self.token:
+            await acache('delete', self.key)
+        self.acquired = False
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
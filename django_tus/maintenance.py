@@ -0,0 +1,137 @@
+import itertools
+import logging
+import os
+
+from django_tus.conf import settings
+from django_tus.fdpool import fd_pool
+from django_tus.layout import destination_path, make_parent_dirs, upload_path, walk_files
+from django_tus.locks import UploadLock
+from django_tus.naming import strip_increment
+from django_tus.state import get_state_store
+from django_tus.tusfile import TusFile
+
+logger = logging.getLogger(__name__)
+
+
+def batched(iterable, size: int):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def scan_upload_dir():
+    """
+    Yields `(resource_id, entry)` for every file in `TUS_UPLOAD_DIR` and its
+    shard directories. Sidecar files like journals are named
+    `<resource id>.<suffix>`, so the same resource id may be yielded more than
+    once.
+    """
+    for entry in walk_files(settings.TUS_UPLOAD_DIR):
+        yield entry.name.partition('.')[0], entry
+
+
+def recover_uploads(batch_size: int = 1000, dry_run: bool = False) -> list:
+    """
+    Reconciles the offsets of the uploads in `TUS_UPLOAD_DIR` with what is
+    known to be on disk, after a crash left them out of sync.
+
+    An upload is rewound to the offset committed by the state store (the
+    journal of `JournaledStateStore`), and never beyond the bytes its storage
+    holds. Uploads whose partial file is gone are removed. Uploads locked by
+    a request in progress are skipped.
+
+    Returns a list of `(resource_id, old_offset, new_offset)`, where
+    `new_offset` is `None` for removed uploads.
+    """
+    store = get_state_store()
+    changes = []
+    for batch in batched(scan_upload_dir(), batch_size):
+        resource_ids = list({resource_id for resource_id, entry in batch})
+        for resource_id, state in store.get_many(resource_ids).items():
+            if state.completion is not None:
+                # Finished, the partial file is gone or about to be.
+                continue
+            lock = UploadLock(resource_id)
+            if not lock.acquire():
+                continue
+            try:
+                tus_file = TusFile(resource_id, state)
+                if not tus_file.is_valid():
+                    changes.append((resource_id, state.offset, None))
+                    if not dry_run:
+                        tus_file.terminate()
+                    continue
+
+                offset = min(store.committed_offset(state), tus_file.get_storage().size(tus_file))
+                if offset != state.offset:
+                    changes.append((resource_id, state.offset, offset))
+                    if not dry_run:
+                        store.set_offset(state, offset)
+            finally:
+                lock.release()
+
+    for resource_id, old_offset, new_offset in changes:
+        logger.warning("Recovered upload %s: offset %s -> %s", resource_id, old_offset, new_offset)
+    return changes
+
+
+def move_entry(entry, path: str, dry_run: bool) -> bool:
+    if entry.path == path:
+        return False
+    if not dry_run:
+        make_parent_dirs(path)
+        os.replace(entry.path, path)
+    return True
+
+
+def reshard_uploads(dry_run: bool = False) -> list:
+    """
+    Moves the partial uploads and their sidecar files to where the current
+    `TUS_UPLOAD_SHARD_DEPTH` expects them, e.g. after sharding a flat
+    `TUS_UPLOAD_DIR`. Uploads locked by a request in progress are skipped.
+
+    Returns a list of `(old_path, new_path)`.
+    """
+    moves = []
+    for resource_id, entry in scan_upload_dir():
+        path = upload_path(resource_id) + entry.name[len(resource_id):]
+        if entry.path == path:
+            continue
+        lock = UploadLock(resource_id)
+        if not lock.acquire():
+            continue
+        try:
+            fd_pool.evict(resource_id)
+            if move_entry(entry, path, dry_run):
+                moves.append((entry.path, path))
+        except FileNotFoundError:
+            pass
+        finally:
+            lock.release()
+    return moves
+
+
+def reshard_destination(dry_run: bool = False) -> list:
+    """
+    Moves the finished uploads in `TUS_DESTINATION_DIR` to where the current
+    `TUS_DESTINATION_SHARD_DEPTH` expects them. References to the files kept
+    elsewhere, e.g. by `tus_upload_finished_signal` receivers, are not
+    updated.
+
+    Returns a list of `(old_path, new_path)`.
+    """
+    moves = []
+    for entry in walk_files(settings.TUS_DESTINATION_DIR):
+        name = entry.name
+        if settings.TUS_FILE_NAME_FORMAT == 'increment':
+            name = strip_increment(name)
+        path = os.path.join(os.path.dirname(destination_path(name)), entry.name)
+        try:
+            if move_entry(entry, path, dry_run):
+                moves.append((entry.path, path))
+        except FileNotFoundError:
+            pass
+    return moves
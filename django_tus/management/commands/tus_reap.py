@@ -0,0 +1,61 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+
+from django_tus.maintenance import batched, scan_upload_dir
+from django_tus.state import get_state_store
+
+
+class Command(BaseCommand):
+    help = "Deletes partial uploads and their sidecar files from TUS_UPLOAD_DIR which have expired or whose upload " \
+           "state is gone."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report the files which would be deleted.")
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of files whose upload state is looked up at once.")
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help="Files modified less than this many seconds ago are kept, so uploads being created aren't reaped.")
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        store = get_state_store()
+        now = time.time()
+        scanned = reaped = reaped_bytes = 0
+
+        for batch in batched(scan_upload_dir(), options['batch_size']):
+            scanned += len(batch)
+            states = store.get_many(list({resource_id for resource_id, entry in batch}))
+
+            for resource_id, entry in batch:
+                state = states.get(resource_id)
+                if state is not None and not state.is_expired(now):
+                    continue
+
+                # Only the candidates are stat'ed.
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if now - stat.st_mtime < options['min_age']:
+                    continue
+
+                if dry_run:
+                    self.stdout.write("Would delete {}".format(entry.path))
+                else:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        continue
+                    if state is not None:
+                        store.delete(resource_id)
+                reaped += 1
+                reaped_bytes += stat.st_size
+
+        self.stdout.write("{} {} of {} partial uploads ({} bytes)".format(
+            "Would delete" if dry_run else "Deleted", reaped, scanned, reaped_bytes))
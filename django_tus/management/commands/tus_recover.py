@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from django_tus.maintenance import recover_uploads
+
+
+class Command(BaseCommand):
+    help = "Reconciles the offsets of partial uploads in TUS_UPLOAD_DIR with the data known to be on disk."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report the uploads which would be changed.")
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Number of files whose upload state is looked up at once.")
+
+    def handle(self, *args, **options):
+        changes = recover_uploads(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        for resource_id, old_offset, new_offset in changes:
+            if new_offset is None:
+                self.stdout.write("{}: partial file is gone, removing upload".format(resource_id))
+            else:
+                self.stdout.write("{}: offset {} -> {}".format(resource_id, old_offset, new_offset))
+        self.stdout.write("{} {} uploads".format("Would recover" if options['dry_run'] else "Recovered", len(changes)))
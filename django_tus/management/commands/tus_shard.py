@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from django_tus.maintenance import reshard_destination, reshard_uploads
+
+
+class Command(BaseCommand):
+    help = "Moves the files in TUS_UPLOAD_DIR to the layout set by TUS_UPLOAD_SHARD_DEPTH."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="Only report the files which would be moved.")
+        parser.add_argument(
+            '--destination', action='store_true',
+            help="Also move the finished uploads in TUS_DESTINATION_DIR to the layout set by "
+                 "TUS_DESTINATION_SHARD_DEPTH. Paths stored by your application are not updated.")
+
+    def handle(self, *args, **options):
+        moves = reshard_uploads(dry_run=options['dry_run'])
+        if options['destination']:
+            moves += reshard_destination(dry_run=options['dry_run'])
+        for old_path, new_path in moves:
+            self.stdout.write("{} -> {}".format(old_path, new_path))
+        self.stdout.write("{} {} files".format("Would move" if options['dry_run'] else "Moved", len(moves)))
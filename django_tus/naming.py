@@ -0,0 +1,108 @@
+import hashlib
+import os
+import random
+import re
+import string
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+class FilenameGenerator:
+    def __init__(self, filename: str = None):
+        if not filename or not isinstance(filename, str):
+            filename = self.random_string()
+        self.filename = filename
+
+    def get_name_and_extension(self):
+        return os.path.splitext(self.filename)
+
+    def create_random_name(self) -> str:
+        name, extension = self.get_name_and_extension()
+        random_string = FilenameGenerator.random_string()
+        return "".join((random_string, extension))
+
+    def create_random_suffix_name(self) -> str:
+        name, extension = self.get_name_and_extension()
+        random_string = FilenameGenerator.random_string()
+        return "".join((name, ".", random_string, extension))
+
+    @classmethod
+    def random_string(cls, length: int = 11) -> str:
+        letters_and_digits = string.ascii_letters + string.digits
+        return''.join((random.choice(letters_and_digits) for i in range(length)))
+
+    def create_incremented_name(self, directory: str = None) -> str:
+        """
+        Returns the next free `<name>.<index><extension>` in `directory`
+        (`TUS_DESTINATION_DIR` by default) and reserves it by creating an
+        empty file, which is replaced by the upload.
+        """
+        directory = directory or settings.TUS_DESTINATION_DIR
+        name, extension = self.get_name_and_extension()
+        while True:
+            filename = '{}.{:04d}{}'.format(name, incremented_name_index.next(directory, name, extension), extension)
+            if reserve_file(os.path.join(directory, filename)):
+                return filename
+
+
+def strip_increment(filename: str) -> str:
+    """
+    Returns the name an incremented name was generated from, or `filename`
+    if it is not one.
+    """
+    name, extension = os.path.splitext(filename)
+    match = re.match(r'^(.*)\.\d{4,}$', name)
+    return match.group(1) + extension if match else filename
+
+
+def reserve_file(path: str) -> bool:
+    """
+    Atomically creates an empty file, returns `False` if it already exists.
+    """
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o666)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    return True
+
+
+class IncrementedNameIndex:
+    """
+    The highest index used by the incremented names of every directory,
+    `<name>` and `<extension>`, shared by all workers through an atomic cache
+    counter.
+
+    A counter missing from the cache is rebuilt from a single scan of the
+    directory; a counter lagging behind the directory only costs a few failed
+    reservations. Counters expire after `TUS_TIMEOUT` seconds, so the names
+    of past uploads don't fill the cache.
+    """
+
+    @staticmethod
+    def key(directory: str, name: str, extension: str) -> str:
+        digest = hashlib.md5('{}\0{}\0{}'.format(directory, name, extension).encode()).hexdigest()
+        return "tus-names/{}".format(digest)
+
+    def next(self, directory: str, name: str, extension: str) -> int:
+        key = self.key(directory, name, extension)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            cache.add(key, self.scan(directory, name, extension), settings.TUS_TIMEOUT)
+            return cache.incr(key)
+
+    @staticmethod
+    def scan(directory: str, name: str, extension: str) -> int:
+        pattern = re.compile(r'^{}\.(\d{{4,}}){}$'.format(re.escape(name), re.escape(extension)))
+        highest = 0
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                match = pattern.match(entry.name)
+                if match:
+                    highest = max(highest, int(match.group(1)))
+        return highest
+
+
+incremented_name_index = IncrementedNameIndex()
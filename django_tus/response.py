@@ -12,9 +12,9 @@ class TusResponse(HttpResponse):
         'Tus-Extension': ",".join(tus_api_extensions),
         'Tus-Max-Size': settings.TUS_MAX_FILE_SIZE,
         'Access-Control-Allow-Origin': "*",
-        'Access-Control-Allow-Methods': "PATCH,HEAD,GET,POST,OPTIONS",
-        'Access-Control-Expose-Headers': "Tus-Resumable,upload-length,upload-metadata,Location,Upload-Offset",
-        'Access-Control-Allow-Headers': "Tus-Resumable,upload-length,upload-metadata,Location,Upload-Offset,content-type",
+        'Access-Control-Allow-Methods': "PATCH,HEAD,GET,POST,DELETE,OPTIONS",
+        'Access-Control-Expose-Headers': "Tus-Resumable,upload-length,upload-metadata,Location,Upload-Offset,Upload-Concat,Upload-Expires,Upload-Completion,Upload-Defer-Length",
+        'Access-Control-Allow-Headers': "Tus-Resumable,upload-length,upload-metadata,Location,Upload-Offset,Upload-Concat,Upload-Checksum,Upload-Defer-Length,content-type",
         'Cache-Control': 'no-store'
     }
 
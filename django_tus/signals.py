@@ -10,4 +10,6 @@ This signal provides the following keyword arguments:
     file_size
     upload_url
     destination_folder
+    digest (hex digest of the file with TUS_UPLOAD_DIGEST, or None)
+    duplicate_of (with TUS_DEDUPLICATE, the filename of the earlier upload the file is linked to, or None)
 """
@@ -0,0 +1,52 @@
+import errno
+import os
+
+from django.conf import settings
+
+from django_tus.counters import ExpiringCounter
+
+PREALLOCATION_MODES = ('sparse', 'posix_fallocate', 'none')
+
+
+def preallocate_file(fd: int, size: int, mode: str):
+    """
+    Reserves `size` bytes for the file behind `fd`, according to the
+    `TUS_PREALLOCATION` mode:
+
+    * `'sparse'` sets the file size, without allocating any blocks.
+    * `'posix_fallocate'` allocates the blocks, raising `ENOSPC` right away if
+      they don't fit. Falls back to `'sparse'` where it's not supported.
+    * `'none'` leaves the file empty, it grows as chunks are appended, so its
+      size is always the offset of the upload.
+    """
+    if mode == 'none' or size <= 0:
+        return
+    if mode == 'posix_fallocate' and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    os.ftruncate(fd, size)
+
+
+def reserves_space() -> bool:
+    """
+    Whether the space of new uploads has to be reserved with
+    `space_reservations`, rather than being allocated by the filesystem.
+    """
+    return settings.TUS_PREALLOCATION != 'posix_fallocate'
+
+
+def free_space(path: str) -> int:
+    stat = os.statvfs(path)
+    return stat.f_bavail * stat.f_frsize
+
+
+space_reservations = ExpiringCounter('tus-space')
+"""
+The bytes promised to uploads but not written yet. Uploads with allocated
+blocks (`posix_fallocate`) are already accounted for by the filesystem and
+aren't reserved.
+"""
@@ -0,0 +1,292 @@
+import os
+import pickle
+import struct
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.module_loading import import_string
+
+from django_tus.asyncutils import acache, run_blocking
+from django_tus.durability import sync_chunk
+from django_tus.layout import make_parent_dirs, upload_path
+
+
+class OffsetConflict(Exception):
+    """
+    Raised when the offset of an upload was advanced by someone else.
+    """
+
+
+class UploadState:
+    """
+    Everything the server needs to know about an upload in progress.
+
+    The filename, size, metadata and flags are stored together as a single
+    record, which only changes again once the upload is finished. The offset
+    is stored on its own, so that it can be advanced atomically without
+    rewriting the record.
+    """
+    __slots__ = ('resource_id', 'offset', 'filename', 'file_size', 'metadata', 'is_partial', 'expires',
+                 'completion', 'digest', 'admission', 'duplicate_of', 'is_final')
+
+    def __init__(self, resource_id: str, filename: str = None, file_size: int = 0, metadata: dict = None,
+                 offset: int = 0, is_partial: bool = False, expires: float = None, completion: str = None,
+                 digest: str = None, admission: tuple = None, duplicate_of: str = None, is_final: bool = False):
+        self.resource_id = resource_id
+        self.offset = offset
+        self.filename = filename
+        self.file_size = file_size
+        self.metadata = metadata or {}
+        self.is_partial = is_partial
+        self.expires = expires if expires is not None else time.time() + settings.TUS_TIMEOUT
+        self.completion = completion
+        self.digest = digest
+        self.admission = admission
+        self.duplicate_of = duplicate_of
+        self.is_final = is_final
+
+    def is_expired(self, now: float = None) -> bool:
+        return self.expires <= (now if now is not None else time.time())
+
+    def to_record(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__[2:])
+
+    @classmethod
+    def from_record(cls, resource_id: str, record: tuple, offset: int):
+        state = cls(resource_id, offset=offset)
+        for name, value in zip(cls.__slots__[2:], record):
+            setattr(state, name, value)
+        return state
+
+
+class CacheStateStore:
+    """
+    Keeps the upload state in the Django cache, using two keys per upload:
+    reading the state is a single `get_many` and advancing the offset a single
+    `incr`.
+    """
+
+    @staticmethod
+    def record_key(resource_id: str) -> str:
+        return "tus-uploads/{}/state".format(resource_id)
+
+    @staticmethod
+    def offset_key(resource_id: str) -> str:
+        return "tus-uploads/{}/offset".format(resource_id)
+
+    def get(self, resource_id: str):
+        return self.get_many([resource_id]).get(resource_id)
+
+    def get_many(self, resource_ids) -> dict:
+        return self._states(resource_ids, cache.get_many(self._keys(resource_ids)))
+
+    async def aget(self, resource_id: str):
+        return (await self.aget_many([resource_id])).get(resource_id)
+
+    async def aget_many(self, resource_ids) -> dict:
+        return self._states(resource_ids, await acache('get_many', self._keys(resource_ids)))
+
+    def _keys(self, resource_ids) -> list:
+        keys = []
+        for resource_id in resource_ids:
+            keys.extend((self.record_key(resource_id), self.offset_key(resource_id)))
+        return keys
+
+    def _states(self, resource_ids, values: dict) -> dict:
+        states = {}
+        for resource_id in resource_ids:
+            record = values.get(self.record_key(resource_id))
+            offset = values.get(self.offset_key(resource_id))
+            if record is not None and offset is not None:
+                states[resource_id] = UploadState.from_record(resource_id, record, offset)
+        return states
+
+    def exists(self, resource_id: str) -> bool:
+        return cache.get(self.record_key(resource_id)) is not None
+
+    def create(self, state: UploadState):
+        self.create_many([state])
+
+    def create_many(self, states):
+        """
+        Stores new uploads with a single `set_many`, all of them expiring with
+        the first one.
+        """
+        values = {}
+        for state in states:
+            values[self.record_key(state.resource_id)] = state.to_record()
+            values[self.offset_key(state.resource_id)] = state.offset
+        if values:
+            cache.set_many(values, max(1, int(min(state.expires for state in states) - time.time())))
+
+    def restore(self, state: UploadState):
+        """
+        Puts an upload back into the cache, keeping the record and offset
+        which are there already, as they are at least as recent.
+        """
+        timeout = max(1, int(state.expires - time.time()))
+        cache.add(self.record_key(state.resource_id), state.to_record(), timeout)
+        cache.add(self.offset_key(state.resource_id), state.offset, timeout)
+
+    def update(self, state: UploadState):
+        """
+        Replaces the record of an upload, leaving its offset alone.
+        """
+        cache.set(self.record_key(state.resource_id), state.to_record(), max(1, int(state.expires - time.time())))
+
+    def incr_offset(self, resource_id: str, delta: int, expected: int = None) -> int:
+        """
+        Advances the offset by `delta`. If the offset was expected to be at
+        `expected` but isn't, the increment is undone and `OffsetConflict`
+        raised, so of two writers racing from the same offset only the first
+        advances it.
+        """
+        offset = cache.incr(self.offset_key(resource_id), delta)
+        if expected is not None and offset != expected + delta:
+            cache.decr(self.offset_key(resource_id), delta)
+            raise OffsetConflict(resource_id)
+        return offset
+
+    def set_offset(self, state: UploadState, offset: int):
+        cache.set(self.offset_key(state.resource_id), offset, max(1, int(state.expires - time.time())))
+        state.offset = offset
+
+    def committed_offset(self, state: UploadState) -> int:
+        """
+        Returns the offset known to be durable, which for the cache is simply
+        the current one.
+        """
+        return state.offset
+
+    def delete(self, resource_id: str):
+        cache.delete_many([self.record_key(resource_id), self.offset_key(resource_id)])
+
+
+class JournaledStateStore(CacheStateStore):
+    """
+    Keeps the upload state in the cache and in a journal file next to the
+    partial upload (`<resource id>.info`), so that it
+    survives cache restarts and evictions.
+
+    Reads are served by the cache; state missing from the cache is rebuilt
+    from the journal. The journal starts with the offset as an 8 byte integer,
+    which is overwritten in place after every chunk, followed by the pickled
+    record. The offset is synced like the chunks themselves, according to
+    `TUS_DURABILITY`, and only once they are.
+    """
+    offset_format = '>Q'
+
+    @staticmethod
+    def journal_path(resource_id: str) -> str:
+        return '{}.info'.format(upload_path(resource_id))
+
+    def read_journal(self, resource_id: str):
+        try:
+            with open(self.journal_path(resource_id), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        offset_size = struct.calcsize(self.offset_format)
+        offset, = struct.unpack(self.offset_format, data[:offset_size])
+        return UploadState.from_record(resource_id, pickle.loads(data[offset_size:]), offset)
+
+    def write_journal_offset(self, resource_id: str, offset: int):
+        fd = os.open(self.journal_path(resource_id), os.O_WRONLY)
+        try:
+            os.pwrite(fd, struct.pack(self.offset_format, offset), 0)
+            sync_chunk(fd)
+        finally:
+            os.close(fd)
+
+    def get_many(self, resource_ids) -> dict:
+        states = super().get_many(resource_ids)
+        states.update(self.rebuild([resource_id for resource_id in resource_ids if resource_id not in states]))
+        return states
+
+    async def aget_many(self, resource_ids) -> dict:
+        states = await super().aget_many(resource_ids)
+        missing = [resource_id for resource_id in resource_ids if resource_id not in states]
+        if missing:
+            states.update(await run_blocking(self.rebuild, missing))
+        return states
+
+    def rebuild(self, resource_ids) -> dict:
+        """
+        Loads the state of uploads missing from the cache from their journals
+        and puts it back into the cache, without touching the journals.
+        """
+        states = {}
+        for resource_id in resource_ids:
+            state = self.read_journal(resource_id)
+            if state is not None and not state.is_expired():
+                self.restore(state)
+                states[resource_id] = state
+        if states:
+            # A concurrent request may have restored and advanced an upload
+            # in between, what is in the cache wins.
+            states.update(CacheStateStore.get_many(self, list(states)))
+        return states
+
+    def exists(self, resource_id: str) -> bool:
+        return self.get(resource_id) is not None
+
+    def write_journal(self, state: UploadState):
+        path = self.journal_path(state.resource_id)
+        tmp_path = '{}.tmp'.format(path)
+        make_parent_dirs(path)
+        with open(tmp_path, 'wb') as f:
+            f.write(struct.pack(self.offset_format, state.offset))
+            f.write(pickle.dumps(state.to_record(), pickle.HIGHEST_PROTOCOL))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def create_many(self, states):
+        for state in states:
+            self.write_journal(state)
+        super().create_many(states)
+
+    def update(self, state: UploadState):
+        self.write_journal(state)
+        super().update(state)
+
+    def incr_offset(self, resource_id: str, delta: int, expected: int = None) -> int:
+        try:
+            offset = super().incr_offset(resource_id, delta, expected)
+        except ValueError:
+            # Evicted from the cache; raises ValueError again if the upload
+            # is gone for good.
+            if not self.rebuild([resource_id]):
+                raise
+            offset = super().incr_offset(resource_id, delta, expected)
+        self.write_journal_offset(resource_id, offset)
+        return offset
+
+    def set_offset(self, state: UploadState, offset: int):
+        self.write_journal_offset(state.resource_id, offset)
+        super().set_offset(state, offset)
+
+    def committed_offset(self, state: UploadState) -> int:
+        journal = self.read_journal(state.resource_id)
+        return journal.offset if journal is not None else state.offset
+
+    def delete(self, resource_id: str):
+        super().delete(resource_id)
+        try:
+            os.remove(self.journal_path(resource_id))
+        except FileNotFoundError:
+            pass
+
+
+_state_stores = {}
+
+
+def get_state_store() -> CacheStateStore:
+    """
+    Returns the state store configured with `TUS_STATE_STORE`.
+    """
+    store_class = settings.TUS_STATE_STORE
+    if store_class not in _state_stores:
+        _state_stores[store_class] = import_string(store_class)()
+    return _state_stores[store_class]
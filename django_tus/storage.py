@@ -0,0 +1,503 @@
+import errno
+import io
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from django_tus.checksum import hash_file
+from django_tus.dedup import deduplicates, digest_index
+from django_tus.durability import sync_chunk, sync_directory, sync_finished_file, syncs_copies
+from django_tus.fdpool import fd_pool
+from django_tus.fileutils import copy_range, link_file, move_file
+from django_tus.layout import destination_path, destination_subdir, make_parent_dirs, upload_path
+from django_tus.naming import FilenameGenerator
+from django_tus.response import TusResponse
+from django_tus.space import free_space, preallocate_file, reserves_space, space_reservations
+
+logger = logging.getLogger(__name__)
+
+
+class UploadWriter:
+    """
+    Writes the bytes of one PATCH request. Nothing written becomes part of
+    the upload before `commit` is called, so a writer closed without commit
+    discards what was written.
+    """
+
+    def write(self, data: bytes):
+        raise NotImplementedError()
+
+    def commit(self):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class UploadStorage:
+    """
+    Where the bytes of the uploads are kept while they are uploaded, and
+    where they go once they are finished.
+    """
+
+    # Whether `concatenate` is implemented, the concatenation extension is
+    # only advertised for storages supporting it.
+    supports_concatenation = False
+
+    def path(self, tus_file) -> str:
+        """
+        Returns the location of the partial upload, as passed to
+        `tus_upload_finished_signal` as `upload_file_path`.
+        """
+        raise NotImplementedError()
+
+    def init(self, tus_file, preallocate: bool = True):
+        """
+        Creates the empty upload, reserving space for all of it if
+        `preallocate` is set and the storage supports it.
+        """
+        raise NotImplementedError()
+
+    def open(self, tus_file, offset: int) -> UploadWriter:
+        """
+        Returns a writer appending to the upload at `offset`.
+        """
+        raise NotImplementedError()
+
+    def exists(self, tus_file) -> bool:
+        raise NotImplementedError()
+
+    def size(self, tus_file) -> int:
+        """
+        Returns the number of bytes kept for the upload.
+        """
+        raise NotImplementedError()
+
+    def finalize(self, tus_file, progress=None):
+        """
+        Moves the finished upload to its destination and updates
+        `tus_file.filename` with its final name. Raises `FileExistsError` if
+        the name is taken and can't be changed.
+        """
+        raise NotImplementedError()
+
+    def abort(self, tus_file):
+        """
+        Deletes everything kept for the upload.
+        """
+        raise NotImplementedError()
+
+    def concatenate(self, tus_file, partials, progress=None):
+        """
+        Fills the upload with the contents of the finished partial uploads.
+        """
+        raise NotImplementedError("{} does not support concatenation".format(self.__class__.__name__))
+
+    def hash(self, tus_file, algorithm: str):
+        """
+        Returns the hex digest of the upload, or `None` if the storage can't
+        read it back.
+        """
+        return None
+
+    def has_space(self, file_size: int) -> bool:
+        """
+        Whether a new upload of `file_size` bytes fits, checked before it is
+        created.
+        """
+        return True
+
+    def declare_length(self, tus_file):
+        """
+        Called once the length of an upload created without one is known.
+        """
+
+
+class FileUploadWriter(UploadWriter):
+    """
+    Writes to a partial upload with `os.pwrite` through a descriptor borrowed
+    from the process wide `fd_pool`. If `expires` is given, the committed
+    bytes are released from the space reserved for the upload.
+
+    With `truncate`, for uploads which aren't preallocated and end at their
+    offset, closing without commit truncates the file back to the offset, so
+    discarded bytes aren't left past it.
+    """
+
+    def __init__(self, resource_id: str, path: str, offset: int, expires: float = None, truncate: bool = False):
+        self.resource_id = resource_id
+        self.fd = fd_pool.acquire(resource_id, path)
+        self.start = self.offset = offset
+        self.expires = expires
+        self.truncate = truncate
+        self.committed = False
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, self.offset)
+            self.offset += written
+            view = view[written:]
+
+    def commit(self):
+        sync_chunk(self.fd)
+        if self.expires is not None:
+            space_reservations.decr(self.expires, self.offset - self.start)
+        self.committed = True
+
+    def close(self):
+        try:
+            if self.truncate and not self.committed and self.offset > self.start:
+                os.ftruncate(self.fd, self.start)
+        finally:
+            fd_pool.release(self.resource_id)
+
+
+class FileSystemUploadStorage(UploadStorage):
+    """
+    Keeps partial uploads as files in `TUS_UPLOAD_DIR` and moves them to
+    `TUS_DESTINATION_DIR` when they are finished. Both directories may be
+    sharded, see `django_tus.layout`.
+    """
+
+    supports_concatenation = True
+
+    def path(self, tus_file) -> str:
+        return upload_path(tus_file.resource_id)
+
+    def init(self, tus_file, preallocate: bool = True):
+        mode = settings.TUS_PREALLOCATION if preallocate else 'none'
+        try:
+            make_parent_dirs(self.path(tus_file))
+            with open(self.path(tus_file), 'wb') as f:
+                preallocate_file(f.fileno(), tus_file.file_size or 0, mode)
+        except IOError as e:
+            if e.errno == errno.ENOSPC:
+                os.remove(self.path(tus_file))
+                return TusResponse(status=507, reason="Not enough space for the upload")
+            error_message = "Unable to create file: {}".format(e)
+            logger.error(error_message, exc_info=True)
+            return TusResponse(status=500, reason=error_message)
+
+        if self.reserves_space(tus_file):
+            space_reservations.incr(tus_file.expires, tus_file.file_size)
+
+    @staticmethod
+    def reserves_space(tus_file) -> bool:
+        # Uploads of unknown length are reserved once they declare it.
+        return reserves_space() and tus_file.file_size is not None
+
+    def declare_length(self, tus_file):
+        if self.reserves_space(tus_file):
+            space_reservations.incr(tus_file.expires, tus_file.file_size - tus_file.offset)
+
+    def open(self, tus_file, offset: int) -> UploadWriter:
+        expires = tus_file.expires if self.reserves_space(tus_file) else None
+        # Preallocated files keep their size. Bytes discarded from them lie
+        # below the length of the upload, and are overwritten by later chunks.
+        truncate = tus_file.file_size is None or settings.TUS_PREALLOCATION == 'none'
+        return FileUploadWriter(tus_file.resource_id, self.path(tus_file), offset, expires=expires,
+                                truncate=truncate)
+
+    def exists(self, tus_file) -> bool:
+        # A pooled descriptor saves the stat on every chunk. It may belong to
+        # a file unlinked by another process since, but terminated uploads
+        # lose their state first, which fails the chunk with 404 anyway.
+        return tus_file.resource_id in fd_pool or os.path.lexists(self.path(tus_file))
+
+    def size(self, tus_file) -> int:
+        return os.path.getsize(self.path(tus_file))
+
+    def finalize(self, tus_file, progress=None):
+
+        setting = settings.TUS_FILE_NAME_FORMAT
+
+        filename = tus_file.filename
+        if setting == 'keep':
+            if self.destination_exists(filename):
+                raise FileExistsError(destination_path(filename))
+        elif setting == 'random':
+            filename = FilenameGenerator(filename).create_random_name()
+        elif setting == 'random-suffix':
+            filename = FilenameGenerator(filename).create_random_suffix_name()
+        elif setting != 'increment':
+            raise ValueError("Unknown TUS_FILE_NAME_FORMAT {!r}".format(setting))
+
+        # Incremented names are sharded by the name they are generated from,
+        # so that they all share one directory and one counter.
+        subdir = destination_subdir(filename)
+        directory = os.path.join(settings.TUS_DESTINATION_DIR, subdir)
+        if subdir:
+            os.makedirs(directory, exist_ok=True)
+        if setting == 'increment':
+            filename = FilenameGenerator(filename).create_incremented_name(directory)
+
+        # The filename passed on is relative to TUS_DESTINATION_DIR.
+        tus_file.filename = os.path.join(subdir, filename)
+        destination = os.path.join(directory, filename)
+        fd_pool.evict(tus_file.resource_id)
+        try:
+            linked = self.link_duplicate(tus_file, destination)
+            if not linked:
+                sync_finished_file(self.path(tus_file))
+                move_file(self.path(tus_file), destination, progress=progress, sync=syncs_copies())
+        except BaseException:
+            if setting == 'increment':
+                # Give up the name reserved by create_incremented_name.
+                os.remove(destination)
+            raise
+        sync_directory(directory)
+
+        if not linked and deduplicates() and tus_file.digest:
+            # The upload is in place already, a missing index entry only
+            # costs a copy of a later duplicate.
+            try:
+                digest_index.add(tus_file.digest, tus_file.filename)
+            except Exception:
+                logger.warning("Unable to index the digest of %s", tus_file.filename, exc_info=True)
+
+    def link_duplicate(self, tus_file, destination: str) -> bool:
+        """
+        Links `destination` to an earlier upload with the same contents, if
+        `TUS_DEDUPLICATE` is set and there is one, and deletes the partial
+        file.
+        """
+        if not deduplicates() or not tus_file.digest:
+            return False
+        duplicate_of = digest_index.find(tus_file.digest, tus_file.file_size)
+        if duplicate_of is None or duplicate_of == tus_file.filename:
+            return False
+        if not link_file(os.path.join(settings.TUS_DESTINATION_DIR, duplicate_of), destination,
+                         settings.TUS_DEDUPLICATE):
+            return False
+        tus_file.duplicate_of = duplicate_of
+        os.remove(self.path(tus_file))
+        return True
+
+    @staticmethod
+    def destination_exists(filename: str) -> bool:
+        return os.path.lexists(destination_path(filename))
+
+    def abort(self, tus_file):
+        fd_pool.evict(tus_file.resource_id)
+        try:
+            os.remove(self.path(tus_file))
+        except FileNotFoundError:
+            return
+        if self.reserves_space(tus_file):
+            space_reservations.decr(tus_file.expires, tus_file.file_size - tus_file.offset)
+
+    def has_space(self, file_size: int) -> bool:
+        return free_space(settings.TUS_UPLOAD_DIR) - space_reservations.value() >= file_size
+
+    def concatenate(self, tus_file, partials, progress=None):
+        make_parent_dirs(self.path(tus_file))
+        dst_fd = os.open(self.path(tus_file), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+        try:
+            offset = 0
+            for partial in partials:
+                src_fd = os.open(self.path(partial), os.O_RDONLY)
+                try:
+                    copy_range(src_fd, dst_fd, partial.file_size, dst_offset=offset, progress=progress)
+                finally:
+                    os.close(src_fd)
+                offset += partial.file_size
+            # The partials are deleted once this returns.
+            if syncs_copies():
+                os.fsync(dst_fd)
+        except BaseException:
+            os.close(dst_fd)
+            self.abort(tus_file)
+            raise
+        os.close(dst_fd)
+        sync_directory(os.path.dirname(self.path(tus_file)))
+
+    def hash(self, tus_file, algorithm: str):
+        return hash_file(self.path(tus_file), algorithm)
+
+
+class S3MultipartUploadWriter(UploadWriter):
+
+    def __init__(self, storage, tus_file, upload: dict):
+        self.storage = storage
+        self.tus_file = tus_file
+        self.upload = upload
+        self.parts = list(upload['parts'])
+        self.buffer = io.BytesIO()
+        if upload['tail_size']:
+            self.buffer.write(storage.read_tail(upload))
+
+    def write(self, data: bytes):
+        self.buffer.write(data)
+        if self.buffer.tell() >= self.storage.part_size:
+            self.upload_part(self.buffer.getvalue())
+            self.buffer = io.BytesIO()
+
+    def upload_part(self, data: bytes):
+        part_number = len(self.parts) + 1
+        response = self.storage.client.upload_part(
+            Bucket=self.storage.bucket, Key=self.upload['key'], UploadId=self.upload['upload_id'],
+            PartNumber=part_number, Body=data)
+        self.parts.append((part_number, response['ETag'], len(data)))
+
+    def commit(self):
+        # Every tail gets a new object, and the previous one is only deleted
+        # once the upload refers to the new one: until then, the saved upload
+        # still describes the previous tail, which is still there.
+        previous_tail_key = self.upload['tail_key']
+        tail = self.buffer.getvalue()
+        tail_key = None
+        if tail:
+            size = sum(part[2] for part in self.parts) + len(tail)
+            tail_key = self.storage.tail_key(self.tus_file, size)
+            self.storage.client.put_object(Bucket=self.storage.bucket, Key=tail_key, Body=tail)
+        self.upload['parts'] = self.parts
+        self.upload['tail_size'] = len(tail)
+        self.upload['tail_key'] = tail_key
+        self.storage.save_upload(self.tus_file, self.upload)
+        if previous_tail_key is not None and previous_tail_key != tail_key:
+            self.storage.client.delete_object(Bucket=self.storage.bucket, Key=previous_tail_key)
+
+
+class S3MultipartUploadStorage(UploadStorage):
+    """
+    Streams uploads into multipart uploads of an S3 compatible object store,
+    so finishing an upload is a metadata operation rather than a copy.
+
+    Every part but the last one has to be at least 5 MB. The bytes at the end
+    of an upload which don't fill a part yet are kept in a temporary object,
+    one per offset they end at, and prepended to the next chunk. The finished
+    object is stored under `TUS_S3_PREFIX<resource id>/<filename>`;
+    `TUS_FILE_NAME_FORMAT` doesn't apply. The multipart upload ids and parts
+    are kept in the cache and, so that they survive its restarts and
+    evictions, in an object next to the tails. Expired uploads are left to
+    the lifecycle rules of the bucket.
+
+    Requires `boto3`, unless a client is passed in.
+    """
+
+    def __init__(self, client=None, bucket: str = None, prefix: str = None, part_size: int = None):
+        self.bucket = bucket or settings.TUS_S3_BUCKET
+        self.prefix = prefix if prefix is not None else settings.TUS_S3_PREFIX
+        self.part_size = part_size or settings.TUS_S3_PART_SIZE
+        self.client = client or self.create_client()
+
+    @staticmethod
+    def create_client():
+        try:
+            import boto3
+        except ImportError:
+            raise ImproperlyConfigured("S3MultipartUploadStorage requires boto3")
+        return boto3.client('s3', endpoint_url=settings.TUS_S3_ENDPOINT_URL or None)
+
+    def path(self, tus_file) -> str:
+        return "{}{}/{}".format(self.prefix, tus_file.resource_id, tus_file.filename)
+
+    def tail_key(self, tus_file, offset: int) -> str:
+        return "{}{}.tail.{}".format(self.prefix, tus_file.resource_id, offset)
+
+    @staticmethod
+    def upload_key(tus_file) -> str:
+        return "tus-uploads/{}/s3".format(tus_file.resource_id)
+
+    def record_key(self, tus_file) -> str:
+        return "{}{}.upload".format(self.prefix, tus_file.resource_id)
+
+    def get_upload(self, tus_file):
+        upload = cache.get(self.upload_key(tus_file))
+        if upload is None:
+            try:
+                record = self.client.get_object(Bucket=self.bucket, Key=self.record_key(tus_file))['Body'].read()
+            except self.client.exceptions.NoSuchKey:
+                return None
+            upload = json.loads(record.decode())
+            cache.add(self.upload_key(tus_file), upload, settings.TUS_TIMEOUT)
+        return upload
+
+    def save_upload(self, tus_file, upload: dict):
+        self.client.put_object(Bucket=self.bucket, Key=self.record_key(tus_file), Body=json.dumps(upload).encode())
+        cache.set(self.upload_key(tus_file), upload, settings.TUS_TIMEOUT)
+
+    def delete_upload(self, tus_file, upload: dict):
+        self.delete_tail(upload)
+        self.client.delete_object(Bucket=self.bucket, Key=self.record_key(tus_file))
+        cache.delete(self.upload_key(tus_file))
+
+    def read_tail(self, upload: dict) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=upload['tail_key'])['Body'].read()
+
+    def init(self, tus_file, preallocate: bool = True):
+        key = self.path(tus_file)
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key)
+        self.save_upload(tus_file, {'key': key, 'upload_id': response['UploadId'], 'parts': [], 'tail_size': 0,
+                                    'tail_key': None})
+
+    def open(self, tus_file, offset: int) -> UploadWriter:
+        upload = self.get_upload(tus_file)
+        if upload is None:
+            raise FileNotFoundError(self.path(tus_file))
+        if offset != self.size(tus_file, upload):
+            raise IOError("S3 uploads can only be appended to")
+        return S3MultipartUploadWriter(self, tus_file, upload)
+
+    def exists(self, tus_file) -> bool:
+        return self.get_upload(tus_file) is not None
+
+    def size(self, tus_file, upload: dict = None) -> int:
+        upload = upload or self.get_upload(tus_file)
+        return sum(part[2] for part in upload['parts']) + upload['tail_size']
+
+    def finalize(self, tus_file, progress=None):
+        upload = self.get_upload(tus_file)
+        if upload is None:
+            raise FileNotFoundError(self.path(tus_file))
+
+        parts = list(upload['parts'])
+        if upload['tail_size'] or not parts:
+            # The tail becomes the last part, which may be smaller than 5 MB.
+            tail = self.read_tail(upload) if upload['tail_size'] else b''
+            response = self.client.upload_part(
+                Bucket=self.bucket, Key=upload['key'], UploadId=upload['upload_id'],
+                PartNumber=len(parts) + 1, Body=tail)
+            parts.append((len(parts) + 1, response['ETag'], len(tail)))
+
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=upload['key'], UploadId=upload['upload_id'],
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag, size in parts]})
+        self.delete_upload(tus_file, upload)
+        tus_file.filename = upload['key']
+
+    def abort(self, tus_file):
+        upload = self.get_upload(tus_file)
+        if upload is None:
+            return
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=upload['key'], UploadId=upload['upload_id'])
+        self.delete_upload(tus_file, upload)
+
+    def delete_tail(self, upload: dict):
+        if upload['tail_key'] is not None:
+            self.client.delete_object(Bucket=self.bucket, Key=upload['tail_key'])
+
+
+_storages = {}
+
+
+def get_upload_storage() -> UploadStorage:
+    """
+    Returns the storage configured with `TUS_STORAGE`.
+    """
+    storage_class = settings.TUS_STORAGE
+    if storage_class not in _storages:
+        _storages[storage_class] = import_string(storage_class)()
+    return _storages[storage_class]
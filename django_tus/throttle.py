@@ -0,0 +1,98 @@
+import threading
+import time
+
+from django.conf import settings
+
+
+class TokenBucket:
+    """
+    Lets `rate` bytes per second through, in bursts of up to `burst` bytes.
+
+    Taking more tokens than there are puts the bucket in debt, which the
+    caller waits off; so concurrent callers share the rate in the order they
+    came.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = burst or rate
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, amount: int) -> float:
+        """
+        Takes `amount` tokens, returning how many seconds to wait before
+        using them.
+        """
+        with self.lock:
+            self.refill(time.monotonic())
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def is_full(self, now: float) -> bool:
+        with self.lock:
+            self.refill(now)
+            return self.tokens >= self.burst
+
+
+class BandwidthLimiter:
+    """
+    Shapes the bandwidth of the PATCH requests of this process, with token
+    buckets for all uploads (`TUS_BANDWIDTH_LIMIT`), for every upload
+    (`TUS_UPLOAD_BANDWIDTH_LIMIT`) and for every client
+    (`TUS_CLIENT_BANDWIDTH_LIMIT`), all in bytes per second.
+    """
+    max_buckets = 1024
+
+    def __init__(self):
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def get_buckets(self, resource_id: str, client_key: str = None) -> list:
+        limits = (
+            ('all', settings.TUS_BANDWIDTH_LIMIT),
+            ('upload/{}'.format(resource_id), settings.TUS_UPLOAD_BANDWIDTH_LIMIT),
+            ('client/{}'.format(client_key), settings.TUS_CLIENT_BANDWIDTH_LIMIT if client_key is not None else None),
+        )
+        buckets = []
+        with self.lock:
+            for key, rate in limits:
+                if not rate:
+                    continue
+                bucket = self.buckets.get(key)
+                if bucket is None or bucket.rate != rate:
+                    if len(self.buckets) >= self.max_buckets:
+                        self.prune()
+                    bucket = self.buckets[key] = TokenBucket(rate)
+                buckets.append(bucket)
+        return buckets
+
+    def prune(self):
+        # Full buckets belong to idle uploads and clients, and are recreated
+        # full when needed again.
+        now = time.monotonic()
+        for key in [key for key, bucket in self.buckets.items() if bucket.is_full(now)]:
+            del self.buckets[key]
+
+    @staticmethod
+    def consume(buckets, amount: int, lock=None):
+        """
+        Waits until `amount` bytes may pass. The wait is sliced well below
+        the lease of `lock`, which is renewed in between, so a slow upload
+        doesn't lose its lock while it's held back.
+        """
+        wait = max((bucket.take(amount) for bucket in buckets), default=0.0)
+        while wait > 0:
+            pause = min(wait, lock.timeout / 4) if lock is not None else wait
+            time.sleep(pause)
+            wait -= pause
+            if lock is not None:
+                lock.renew()
+
+
+bandwidth_limiter = BandwidthLimiter()
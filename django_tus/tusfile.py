@@ -1,141 +1,229 @@
 import logging
 import os
-import random
-import shutil
-import string
+import time
 import uuid
 
 from django.conf import settings
-from django.core.cache import cache
-from django.core.files.storage import FileSystemStorage
+from django.http.request import UnreadablePostError
 
+from django_tus.admission import active_uploads, get_client_key
+from django_tus.checksum import new_hash, parse_checksum_header, upload_digests
+from django_tus.layout import destination_path
+from django_tus.locks import LockLost
+from django_tus.naming import FilenameGenerator  # noqa: F401
 from django_tus.response import Tus404, TusResponse
+from django_tus.state import OffsetConflict, UploadState, get_state_store
+from django_tus.storage import get_upload_storage
+from django_tus.throttle import bandwidth_limiter
 
 logger = logging.getLogger(__name__)
 
 
-class FilenameGenerator:
-    def __init__(self, filename: str = None):
-        if not filename or not isinstance(filename, str):
-            filename = self.random_string()
-        self.filename = filename
+class UploadCreationError(Exception):
+    """
+    Raised when the storage can't create an upload, with the response to
+    return to the client.
+    """
 
-    def get_name_and_extension(self):
-        return os.path.splitext(self.filename)
-
-    def create_random_name(self) -> str:
-        name, extension = self.get_name_and_extension()
-        random_string = FilenameGenerator.random_string()
-        return "".join((random_string, extension))
-
-    def create_random_suffix_name(self) -> str:
-        name, extension = self.get_name_and_extension()
-        random_string = FilenameGenerator.random_string()
-        return "".join((name, ".", random_string, extension))
-
-    @classmethod
-    def random_string(cls, length: int = 11) -> str:
-        letters_and_digits = string.ascii_letters + string.digits
-        return''.join((random.choice(letters_and_digits) for i in range(length)))
-
-    def create_incremented_name(self) -> str:
-        index = 1
-        name, extension = self.get_name_and_extension()
-        while True:
-            filename = '{}.{:04d}{}'.format(name, index, extension)
-            index += 1
-            if not os.path.lexists(os.path.join(settings.TUS_DESTINATION_DIR, filename)):
-                break
-        return filename
+    def __init__(self, response):
+        super().__init__(response.reason_phrase)
+        self.response = response
 
 
 class TusFile:
 
     def get_storage(self):
-        return FileSystemStorage()
+        return get_upload_storage()
 
-    def __init__(self, resource_id: str):
+    def __init__(self, resource_id: str, state: UploadState = None):
+        if state is None:
+            state = get_state_store().get(resource_id)
         self.resource_id = resource_id
-        self.filename = cache.get("tus-uploads/{}/filename".format(resource_id))
-        self.file_size = int(cache.get("tus-uploads/{}/file_size".format(resource_id)))
-        self.metadata = cache.get("tus-uploads/{}/metadata".format(resource_id))
-        self.offset = cache.get("tus-uploads/{}/offset".format(resource_id))
+        self.filename = state.filename
+        self.file_size = state.file_size
+        self.metadata = state.metadata
+        self.offset = state.offset
+        self.is_partial = state.is_partial
+        self.expires = state.expires
+        self.completion = state.completion
+        self.digest = state.digest
+        self.admission = state.admission
+        self.duplicate_of = state.duplicate_of
+        self.is_final = state.is_final
 
     @staticmethod
     def get_tusfile_or_404(resource_id):
-        if TusFile.resource_exists(str(resource_id)):
-            return TusFile(resource_id)
-        else:
+        state = get_state_store().get(str(resource_id))
+        if state is None:
             raise Tus404()
+        return TusFile(str(resource_id), state)
 
     @staticmethod
     def resource_exists(resource_id: str):
-        return cache.get("tus-uploads/{}/filename".format(resource_id), None) is not None
+        return get_state_store().exists(resource_id)
 
     @staticmethod
-    def create_initial_file(metadata, file_size: int):
+    def create_initial_file(metadata, file_size: int, is_partial: bool = False, preallocate: bool = True,
+                            client_key: str = None):
         resource_id = str(uuid.uuid4())
-        cache.add("tus-uploads/{}/filename".format(resource_id), "{}".format(metadata.get("filename")), settings.TUS_TIMEOUT)
-        cache.add("tus-uploads/{}/file_size".format(resource_id), file_size, settings.TUS_TIMEOUT)
-        cache.add("tus-uploads/{}/offset".format(resource_id), 0, settings.TUS_TIMEOUT)
-        cache.add("tus-uploads/{}/metadata".format(resource_id), metadata, settings.TUS_TIMEOUT)
-
-        tus_file = TusFile(resource_id)
-        tus_file.write_init_file()
+        state = UploadState(resource_id, "{}".format(metadata.get("filename")), file_size, metadata,
+                            is_partial=is_partial)
+        state.admission = TusFile.admit(client_key, state.expires)
+        get_state_store().create(state)
+
+        tus_file = TusFile(resource_id, state)
+        response = tus_file.write_init_file(preallocate=preallocate)
+        if response is not None:
+            tus_file.clean()
+            raise UploadCreationError(response)
         return tus_file
 
-    def is_valid(self):
-        return self.filename is not None and os.path.lexists(self.get_path())
+    @staticmethod
+    def create_initial_files(uploads, client_key: str = None) -> list:
+        """
+        Creates many uploads at once from a list of `(metadata, file_size)`,
+        storing their state with a single write.
+        """
+        expires = time.time() + settings.TUS_TIMEOUT
+        admission = TusFile.admit(client_key, expires, len(uploads))
+        states = [UploadState(str(uuid.uuid4()), "{}".format(metadata.get("filename")), file_size, metadata,
+                              expires=expires, admission=admission)
+                  for metadata, file_size in uploads]
+        get_state_store().create_many(states)
+
+        tus_files = [TusFile(state.resource_id, state) for state in states]
+        for index, tus_file in enumerate(tus_files):
+            response = tus_file.write_init_file()
+            if response is not None:
+                for created in tus_files[:index]:
+                    created.terminate()
+                for failed in tus_files[index:]:
+                    failed.clean()
+                raise UploadCreationError(response)
+        return tus_files
 
-    def get_path(self):
-        return os.path.join(settings.TUS_UPLOAD_DIR, self.resource_id)
+    @staticmethod
+    def admit(client_key: str, expires: float, count: int = 1):
+        admission = active_uploads.acquire(client_key or '', expires, count)
+        if admission is None:
+            raise UploadCreationError(TusResponse(status=429, reason="Too many uploads in progress"))
+        return admission
+
+    @staticmethod
+    def create_final_file(metadata, partials, progress=None, client_key: str = None):
+        """
+        Concatenates finished partial uploads into a new upload, which is
+        complete right away and only stored in the state store once it is
+        finished. It counts as in progress until the caller releases its
+        admission.
+        """
+        resource_id = str(uuid.uuid4())
+        file_size = sum(partial.file_size for partial in partials)
+        state = UploadState(resource_id, "{}".format(metadata.get("filename")), file_size, metadata, offset=file_size,
+                            is_final=True)
+        state.admission = TusFile.admit(client_key, state.expires)
 
-    def rename(self):
+        tus_file = TusFile(resource_id, state)
+        try:
+            tus_file.write_concatenated_file(partials, progress=progress)
+        except Exception:
+            tus_file.release_admission()
+            raise
+        return tus_file
 
-        setting = settings.TUS_FILE_NAME_FORMAT
+    def is_valid(self):
+        return self.filename is not None and self.get_storage().exists(self)
 
-        if setting == 'keep':
-            if self.check_existing_file(self.filename):
-                return TusResponse(status=409, reason="File with same name already exists")
-        elif setting == 'random':
-            self.filename = FilenameGenerator(self.filename).create_random_name()
-        elif setting == 'random-suffix':
-            self.filename = FilenameGenerator(self.filename).create_random_suffix_name()
-        elif setting == 'increment':
-            self.filename = FilenameGenerator(self.filename).create_incremented_name()
-        else:
-            return ValueError()
+    def get_path(self):
+        return self.get_storage().path(self)
 
-        shutil.move(self.get_path(), os.path.join(settings.TUS_DESTINATION_DIR, self.filename))
+    def rename(self, progress=None):
+        return self.get_storage().finalize(self, progress=progress)
 
     def clean(self):
-        cache.delete_many([
-            "tus-uploads/{}/file_size".format(self.resource_id),
-            "tus-uploads/{}/filename".format(self.resource_id),
-            "tus-uploads/{}/offset".format(self.resource_id),
-            "tus-uploads/{}/metadata".format(self.resource_id),
-        ])
+        get_state_store().delete(self.resource_id)
+        if self.completion is None:
+            self.release_admission()
+
+    def release_admission(self):
+        """
+        Stops counting the upload as in progress, see `ActiveUploads`.
+        """
+        active_uploads.release(self.admission, self.expires)
+        self.admission = None
+
+    def get_state(self) -> UploadState:
+        return UploadState(
+            self.resource_id, self.filename, self.file_size, self.metadata, offset=self.offset,
+            is_partial=self.is_partial, expires=self.expires, completion=self.completion, digest=self.digest,
+            admission=self.admission, duplicate_of=self.duplicate_of, is_final=self.is_final)
+
+    def save_state(self):
+        """
+        Stores the filename, completion status and digests of a finished
+        upload.
+        """
+        get_state_store().update(self.get_state())
+
+    def remove(self):
+        self.get_storage().abort(self)
+
+    def terminate(self):
+        """
+        Deletes the upload. The state goes first, so no new PATCH can start;
+        a PATCH still in flight keeps writing to the unlinked file, whose space
+        is freed as soon as it's closed, and then fails to advance the offset.
+        """
+        self.clean()
+        self.remove()
+        upload_digests.discard(self.resource_id)
 
     @staticmethod
     def check_existing_file(filename: str):
-        return os.path.lexists(os.path.join(settings.TUS_DESTINATION_DIR, filename))
+        return os.path.lexists(destination_path(filename))
 
-    def write_init_file(self):
-        try:
-            with open(self.get_path(), 'wb') as f:
-                f.seek(self.file_size - 1)
-                f.write(b'\0')
-        except IOError as e:
-            error_message = "Unable to create file: {}".format(e)
-            logger.error(error_message, exc_info=True)
-            return TusResponse(status=500, reason=error_message)
-
-    def write_chunk(self, chunk):
+    def write_init_file(self, preallocate: bool = True):
+        return self.get_storage().init(self, preallocate=preallocate)
+
+    def write_concatenated_file(self, partials, progress=None):
+        self.get_storage().concatenate(self, partials, progress=progress)
+
+    def write_chunk(self, chunk, lock=None):
+        file_digest = None
+        if settings.TUS_UPLOAD_DIGEST:
+            file_digest = upload_digests.get(self.resource_id, chunk.offset, settings.TUS_UPLOAD_DIGEST)
+
+        buckets = bandwidth_limiter.get_buckets(self.resource_id, chunk.client_key)
+
+        written = 0
         try:
-            with open(self.get_path(), 'r+b') as f:
-                f.seek(chunk.offset)
-                f.write(chunk.content)
-            self.offset = cache.incr("tus-uploads/{}/offset".format(self.resource_id), chunk.chunk_size)
+            with self.get_storage().open(self, chunk.offset) as writer:
+                for block in chunk:
+                    if buckets:
+                        bandwidth_limiter.consume(buckets, len(block), lock=lock)
+                    writer.write(block)
+                    written += len(block)
+                    if file_digest is not None:
+                        file_digest.update(block)
+                    if lock is not None:
+                        lock.renew()
+
+                if not chunk.checksum_matches():
+                    # The writer is closed without commit, discarding the
+                    # written bytes.
+                    return TusResponse(status=460, reason="Checksum Mismatch")
+                if lock is not None and not lock.is_held():
+                    raise LockLost(self.resource_id)
+                writer.commit()
+
+        except LockLost:
+            # The lease expired and another request owns the upload now.
+            upload_digests.discard(self.resource_id)
+            return TusResponse(status=409, reason="Upload lock was lost")
+
+        except FileNotFoundError:
+            upload_digests.discard(self.resource_id)
+            return TusResponse(status=404, reason="Upload was terminated")
 
         except IOError:
             logger.error("patch", extra={'request': chunk.META, 'tus': {
@@ -148,6 +236,28 @@ class TusFile:
             }})
             return TusResponse(status=500)
 
+        # Persist the bytes which actually made it to disk, even if the
+        # client went away in the middle of the request body.
+        if written:
+            try:
+                self.offset = get_state_store().incr_offset(self.resource_id, written, expected=chunk.offset)
+            except OffsetConflict:
+                upload_digests.discard(self.resource_id)
+                return TusResponse(status=409, reason="Upload offset was changed by another request")
+            except ValueError:
+                # The state is gone: the upload was terminated while this
+                # chunk was written.
+                upload_digests.discard(self.resource_id)
+                return TusResponse(status=404, reason="Upload was terminated")
+
+        if file_digest is not None:
+            if self.is_complete():
+                self.digest = file_digest.hexdigest()
+            else:
+                upload_digests.set(self.resource_id, self.offset, file_digest)
+        elif settings.TUS_UPLOAD_DIGEST and self.is_complete():
+            self.digest = self.get_storage().hash(self, settings.TUS_UPLOAD_DIGEST)
+
     def is_complete(self):
         return self.offset == self.file_size
 
@@ -164,8 +274,47 @@ class TusInitFile:
 
 
 class TusChunk:
-    def __init__(self, request):
+    """
+    The body of a PATCH request. Iterating over a chunk streams the body in
+    blocks of at most `TUS_CHUNK_BUFFER_SIZE` bytes, so the whole chunk is
+    never held in memory. A client disconnecting in the middle of the body
+    ends the iteration and sets `interrupted`.
+
+    If the request has an `Upload-Checksum` header, the checksum is computed
+    over the blocks as they are read.
+    """
+    def __init__(self, request, offset: int = None):
         self.META = request.META
-        self.offset = int(request.META.get("HTTP_UPLOAD_OFFSET", 0))
+        self.offset = offset if offset is not None else int(request.META.get("HTTP_UPLOAD_OFFSET", 0))
         self.chunk_size = int(request.META.get("CONTENT_LENGTH", 102400))
-        self.content = request.body
+        self.stream = request
+        self.interrupted = False
+        self.client_key = get_client_key(request) if settings.TUS_CLIENT_BANDWIDTH_LIMIT else None
+
+        self.checksum = None
+        self.expected_checksum = None
+        if request.META.get("HTTP_UPLOAD_CHECKSUM"):
+            algorithm, self.expected_checksum = parse_checksum_header(request.META["HTTP_UPLOAD_CHECKSUM"])
+            self.checksum = new_hash(algorithm)
+
+    def checksum_matches(self):
+        if self.checksum is None:
+            return True
+        # The checksum covers the whole chunk, an interrupted chunk can't be verified.
+        return not self.interrupted and self.checksum.digest() == self.expected_checksum
+
+    def __iter__(self):
+        remaining = self.chunk_size
+        while remaining > 0:
+            try:
+                block = self.stream.read(min(remaining, settings.TUS_CHUNK_BUFFER_SIZE))
+            except UnreadablePostError:
+                self.interrupted = True
+                return
+            if not block:
+                self.interrupted = True
+                return
+            remaining -= len(block)
+            if self.checksum is not None:
+                self.checksum.update(block)
+            yield block
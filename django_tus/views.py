@@ -1,14 +1,28 @@
+import asyncio
 import base64
+import json
 import logging
+from functools import update_wrapper
 
-from django.utils.decorators import method_decorator
+from django.urls import reverse
+from django.utils.decorators import classonlymethod, method_decorator
+from django.utils.http import http_date
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
 
+from django_tus import tus_api_extensions
+from django_tus.admission import get_client_key
+from django_tus.asyncutils import run_blocking
+from django_tus.completion import DONE, FINALIZED, PENDING, get_completion_backend
 from django_tus.conf import settings
-from django_tus.response import TusResponse
+from django_tus.locks import UploadLock
+from django_tus.response import Tus404, TusResponse
+from django_tus.checksum import CHECKSUM_ALGORITHMS
 from django_tus.signals import tus_upload_finished_signal
-from django_tus.tusfile import TusFile, TusChunk, FilenameGenerator
+from django_tus.state import get_state_store
+from django_tus.naming import FilenameGenerator
+from django_tus.storage import get_upload_storage
+from django_tus.tusfile import TusFile, TusChunk, UploadCreationError
 from pathvalidate import is_valid_filename
 
 logger = logging.getLogger(__name__)
@@ -51,7 +65,11 @@ class TusUpload(View):
         return metadata
 
     def options(self, request, *args, **kwargs):
-        return TusResponse(status=204)
+        extra_headers = {'Tus-Checksum-Algorithm': ",".join(CHECKSUM_ALGORITHMS)}
+        if not get_upload_storage().supports_concatenation:
+            extra_headers['Tus-Extension'] = ",".join(
+                extension for extension in tus_api_extensions if extension != 'concatenation')
+        return TusResponse(status=204, extra_headers=extra_headers)
 
     def post(self, request, *args, **kwargs):
 
@@ -66,9 +84,159 @@ class TusUpload(View):
         if settings.TUS_EXISTING_FILE == 'error' and settings.TUS_FILE_NAME_FORMAT == 'keep' and TusFile.check_existing_file(metadata.get("filename")):
             return TusResponse(status=409, reason="File with same name already exists")
 
-        file_size = int(request.META.get("HTTP_UPLOAD_LENGTH", "0"))  # TODO: check min max upload size
-
-        tus_file = TusFile.create_initial_file(metadata, file_size)
+        upload_concat = request.META.get("HTTP_UPLOAD_CONCAT", "")
+        if upload_concat.startswith("final;"):
+            return self.post_final(request, metadata, upload_concat[len("final;"):].split())
+
+        # creation-defer-length: the length is declared by a later PATCH.
+        defer_length = request.META.get("HTTP_UPLOAD_DEFER_LENGTH")
+        if defer_length is not None and defer_length != "1":
+            return TusResponse(status=400, reason="Invalid Upload-Defer-Length")
+        file_size = None
+        if "HTTP_UPLOAD_LENGTH" in request.META or defer_length is None:
+            try:
+                file_size = int(request.META.get("HTTP_UPLOAD_LENGTH", "0"))
+            except ValueError:
+                return TusResponse(status=400, reason="Invalid upload length")
+            response = self.check_file_size(file_size)
+            if response is not None:
+                return response
+
+        # creation-with-upload: the body is the first chunk of the upload.
+        chunk = None
+        if request.META.get("CONTENT_TYPE") == "application/offset+octet-stream":
+            try:
+                chunk = TusChunk(request, offset=0)
+            except ValueError as e:
+                return TusResponse(status=400, reason=str(e))
+            if chunk.chunk_size > self.max_length(file_size):
+                return TusResponse(status=413)
+
+        if not get_upload_storage().has_space(file_size or 0):
+            return TusResponse(status=507, reason="Not enough space for the upload")
+
+        # Space is only worth reserving for uploads still to be resumed, and
+        # can't be for uploads of unknown length, which are appended to.
+        try:
+            tus_file = TusFile.create_initial_file(
+                metadata, file_size, is_partial=upload_concat == "partial",
+                preallocate=file_size is not None and (chunk is None or chunk.chunk_size < file_size),
+                client_key=get_client_key(request))
+        except UploadCreationError as e:
+            return e.response
+
+        extra_headers = {
+            'Location': '{}{}'.format(request.build_absolute_uri(), tus_file.resource_id),
+            'Upload-Expires': http_date(tus_file.expires)}
+        if chunk is not None:
+            response = self.write_creation_chunk(tus_file, chunk)
+            if response is not None:
+                return response
+            extra_headers['Upload-Offset'] = tus_file.offset
+            if tus_file.completion:
+                extra_headers['Upload-Completion'] = tus_file.completion
+
+        return TusResponse(status=201, extra_headers=extra_headers)
+
+    @staticmethod
+    def max_length(file_size: int = None) -> int:
+        return file_size if file_size is not None else settings.TUS_MAX_FILE_SIZE
+
+    @staticmethod
+    def check_file_size(file_size: int):
+        if file_size > settings.TUS_MAX_FILE_SIZE:
+            return TusResponse(status=413, reason="Upload is larger than {} bytes".format(settings.TUS_MAX_FILE_SIZE))
+        if file_size < settings.TUS_MIN_FILE_SIZE:
+            return TusResponse(status=400, reason="Upload is smaller than {} bytes".format(settings.TUS_MIN_FILE_SIZE))
+
+    def write_creation_chunk(self, tus_file, chunk):
+        lock = UploadLock(tus_file.resource_id)
+        if not lock.acquire():
+            # The upload is created all the same, the client resumes it from
+            # the offset returned.
+            return None
+        try:
+            # A chunk failing its checksum is simply discarded, the client
+            # resumes from the offset returned. Any other error leaves the
+            # upload in an unknown state and without a Location to resume it
+            # from, so it is terminated.
+            response = tus_file.write_chunk(chunk=chunk, lock=lock)
+            if response is not None and response.status_code != 460:
+                tus_file.terminate()
+                return response
+
+            if tus_file.is_complete() and not tus_file.is_partial:
+                return self.finish_upload(tus_file, lock)
+        finally:
+            lock.release()
+
+    def post_final(self, request, metadata, partial_urls):
+        """
+        Creates the final upload of the concatenation extension from a list of
+        finished partial uploads.
+        """
+        storage = get_upload_storage()
+        if not storage.supports_concatenation:
+            return TusResponse(status=501, reason="Concatenation is not supported")
+
+        resource_ids = [url.rstrip('/').rsplit('/', 1)[-1] for url in partial_urls]
+        if not resource_ids:
+            return TusResponse(status=400, reason="No partial uploads given")
+        if len(set(resource_ids)) != len(resource_ids):
+            return TusResponse(status=400, reason="Partial uploads must not be repeated")
+
+        locks = [UploadLock(resource_id) for resource_id in resource_ids]
+        try:
+            for lock in locks:
+                if not lock.acquire():
+                    return TusResponse(status=423, reason="Upload is locked by another request")
+
+            states = get_state_store().get_many(resource_ids)
+            if len(states) != len(resource_ids):
+                return TusResponse(status=404, reason="Partial upload not found")
+
+            partials = [TusFile(resource_id, states[resource_id]) for resource_id in resource_ids]
+            if not all(partial.is_partial and partial.is_complete() for partial in partials):
+                return TusResponse(status=400, reason="Uploads must be finished partial uploads")
+
+            file_size = sum(partial.file_size for partial in partials)
+            response = self.check_file_size(file_size)
+            if response is not None:
+                return response
+            if not storage.has_space(file_size):
+                return TusResponse(status=507, reason="Not enough space for the upload")
+
+            def renew_locks(copied, total):
+                for lock in locks:
+                    lock.renew()
+
+            try:
+                tus_file = TusFile.create_final_file(
+                    metadata, partials, progress=renew_locks, client_key=get_client_key(request))
+            except UploadCreationError as e:
+                return e.response
+            try:
+                tus_file.rename(progress=renew_locks)
+            except FileExistsError:
+                tus_file.get_storage().abort(tus_file)
+                tus_file.release_admission()
+                return TusResponse(status=409, reason="File with same name already exists")
+            tus_file.release_admission()
+
+            # Kept like uploads completed in the background, so HEAD requests
+            # to the final upload succeed until it expires.
+            tus_file.completion = DONE
+            get_state_store().create(tus_file.get_state())
+
+            for partial in partials:
+                partial.remove()
+                partial.clean()
+        finally:
+            for lock in locks:
+                lock.release()
+
+        self.send_signal(tus_file)
+        self.finished()
 
         return TusResponse(
             status=201,
@@ -78,15 +246,64 @@ class TusUpload(View):
 
         tus_file = TusFile.get_tusfile_or_404(str(resource_id))
 
-        return TusResponse(status=200,
-                           extra_headers={
-                               'Upload-Offset': tus_file.offset,
-                               'Upload-Length': tus_file.file_size})
+        return self.head_response(tus_file)
+
+    def head_response(self, tus_file):
+        extra_headers = {
+            'Upload-Offset': tus_file.offset,
+            'Upload-Expires': http_date(tus_file.expires)}
+        if tus_file.file_size is not None:
+            extra_headers['Upload-Length'] = tus_file.file_size
+        else:
+            extra_headers['Upload-Defer-Length'] = 1
+        if tus_file.is_partial:
+            extra_headers['Upload-Concat'] = 'partial'
+        if tus_file.completion:
+            extra_headers['Upload-Completion'] = tus_file.completion
+
+        return TusResponse(status=200, extra_headers=extra_headers)
+
+    def get(self, request, resource_id):
+        """
+        Returns the completion status of an upload finished with
+        `TUS_COMPLETION_BACKEND`, for clients polling it.
+        """
+        tus_file = TusFile.get_tusfile_or_404(str(resource_id))
+
+        return self.status_response(tus_file)
+
+    def status_response(self, tus_file):
+        status = {
+            'offset': tus_file.offset,
+            'length': tus_file.file_size,
+            'completion': tus_file.completion,
+            'filename': tus_file.filename if tus_file.completion else None,
+        }
+        return TusResponse(status=200, content=json.dumps(status), content_type='application/json')
 
     def patch(self, request, resource_id, *args, **kwargs):
 
+        # Only one request at a time may write to an upload. The lock is taken
+        # before the state is read, so the offset checked below can't change
+        # until the chunk has been written.
+        lock = UploadLock(str(resource_id))
+        if not lock.acquire():
+            return TusResponse(status=423, reason="Upload is locked by another request")
+
+        try:
+            return self.write_locked_chunk(request, resource_id, lock)
+        finally:
+            lock.release()
+
+    def write_locked_chunk(self, request, resource_id, lock):
+
         tus_file = TusFile.get_tusfile_or_404(str(resource_id))
-        chunk = TusChunk(request)
+        if tus_file.is_final:
+            return TusResponse(status=403, reason="Final uploads can't be patched")
+        try:
+            chunk = TusChunk(request)
+        except ValueError as e:
+            return TusResponse(status=400, reason=str(e))
 
         if not tus_file.is_valid():
             return TusResponse(status=410)
@@ -94,20 +311,98 @@ class TusUpload(View):
         if chunk.offset != tus_file.offset:
             return TusResponse(status=409)
 
-        if chunk.offset > tus_file.file_size:
+        if tus_file.file_size is None and "HTTP_UPLOAD_LENGTH" in request.META:
+            response = self.declare_length(tus_file, request.META["HTTP_UPLOAD_LENGTH"])
+            if response is not None:
+                return response
+
+        if chunk.offset + chunk.chunk_size > self.max_length(tus_file.file_size):
             return TusResponse(status=413)
 
-        tus_file.write_chunk(chunk=chunk)
+        if tus_file.completion:
+            # Nothing left to write, the upload is finished already.
+            return TusResponse(status=204, extra_headers={
+                'Upload-Offset': tus_file.offset,
+                'Upload-Completion': tus_file.completion})
+
+        response = tus_file.write_chunk(chunk=chunk, lock=lock)
+        if response is not None:
+            return response
+
+        if tus_file.is_complete() and not tus_file.is_partial:
+            response = self.finish_upload(tus_file, lock)
+            if response is not None:
+                return response
+
+            extra_headers = {'Upload-Offset': tus_file.offset}
+            if tus_file.completion:
+                extra_headers['Upload-Completion'] = tus_file.completion
+            return TusResponse(status=204, extra_headers=extra_headers)
+
+        return TusResponse(status=204, extra_headers={
+            'Upload-Offset': tus_file.offset,
+            'Upload-Expires': http_date(tus_file.expires)})
+
+    def declare_length(self, tus_file, upload_length: str):
+        """
+        Sets the length of an upload created with `Upload-Defer-Length`.
+        """
+        try:
+            file_size = int(upload_length)
+        except ValueError:
+            return TusResponse(status=400, reason="Invalid upload length")
+        response = self.check_file_size(file_size)
+        if response is not None:
+            return response
+        if file_size < tus_file.offset:
+            return TusResponse(status=400, reason="Upload length is smaller than the offset")
+
+        tus_file.file_size = file_size
+        tus_file.save_state()
+        tus_file.get_storage().declare_length(tus_file)
+
+    def finish_upload(self, tus_file, lock):
+        """
+        Moves a finished upload to its destination and announces it, or leaves
+        that to `TUS_COMPLETION_BACKEND`. Returns an error response, if any.
+        """
+        backend = get_completion_backend()
+        if backend is not None:
+            # Leave the rest to the backend, so that the client doesn't wait
+            # for it.
+            tus_file.release_admission()
+            tus_file.completion = PENDING
+            tus_file.save_state()
+            backend.submit(tus_file.resource_id, self.__class__)
+            return None
+
+        # file transfer complete, rename from resource id to actual filename
+        try:
+            tus_file.rename(progress=lambda copied, total: lock.renew())
+        except FileNotFoundError:
+            return TusResponse(status=404, reason="Upload was terminated")
+        except FileExistsError:
+            # The upload can't be finished under its name, nor resumed.
+            tus_file.terminate()
+            return TusResponse(status=409, reason="File with same name already exists")
+        tus_file.clean()
+
+        self.send_signal(tus_file)
+        self.finished()
 
-        if tus_file.is_complete():
-            # file transfer complete, rename from resource id to actual filename
-            tus_file.rename()
-            tus_file.clean()
+    def delete(self, request, resource_id, *args, **kwargs):
 
-            self.send_signal(tus_file)
-            self.finished()
+        tus_file = TusFile.get_tusfile_or_404(str(resource_id))
+        if tus_file.completion in (PENDING, FINALIZED):
+            return TusResponse(status=409, reason="Upload is being completed")
 
-        return TusResponse(status=204, extra_headers={'Upload-Offset': tus_file.offset})
+        # The lock isn't taken: clients typically abort a PATCH and delete the
+        # upload right away, while the lease of the aborted request is still
+        # running. Terminating under a PATCH in flight is safe, see
+        # `TusFile.terminate`, and frees the disk space immediately.
+        tus_file.terminate()
+
+        return TusResponse(status=204)
 
     def send_signal(self, tus_file):
         tus_upload_finished_signal.send(
@@ -117,7 +412,9 @@ class TusUpload(View):
             upload_file_path=tus_file.get_path(),
             file_size=tus_file.file_size,
             upload_url=settings.TUS_UPLOAD_URL,
-            destination_folder=settings.TUS_DESTINATION_DIR)
+            destination_folder=settings.TUS_DESTINATION_DIR,
+            digest=tus_file.digest,
+            duplicate_of=tus_file.duplicate_of)
 
     def validate_filename(self, metadata):
         filename = metadata.get("filename", "")
@@ -126,3 +423,154 @@ class TusUpload(View):
         return filename
 
 
+class TusBatchUpload(TusUpload):
+    """
+    Creates many uploads with a single request, so that uploading a folder of
+    small files isn't dominated by a POST per file.
+
+    The request body is a JSON list of `{"length": ..., "metadata": {...}}`
+    objects, with plain (not base64 encoded) metadata values. The response
+    lists the `Location` of every upload, in the same order. The uploads are
+    resumed with the `TusUpload` view named `upload_url_name`.
+    """
+    http_method_names = ['post', 'options']
+    upload_url_name = 'tus_upload'
+
+    def post(self, request, *args, **kwargs):
+        try:
+            uploads = json.loads(request.body.decode())
+        except ValueError:
+            return TusResponse(status=400, reason="Invalid JSON")
+        if not isinstance(uploads, list) or not all(isinstance(upload, dict) for upload in uploads):
+            return TusResponse(status=400, reason="Expected a list of uploads")
+        if len(uploads) > settings.TUS_BULK_MAX_UPLOADS:
+            return TusResponse(status=413, reason="Too many uploads")
+
+        specs = []
+        for upload in uploads:
+            metadata = upload.get("metadata") or {}
+            if not isinstance(metadata, dict):
+                return TusResponse(status=400, reason="Invalid upload metadata")
+            metadata = {str(key): str(value) for key, value in metadata.items()}
+            metadata["filename"] = self.validate_filename(metadata)
+            if settings.TUS_EXISTING_FILE == 'error' and settings.TUS_FILE_NAME_FORMAT == 'keep' \
+                    and TusFile.check_existing_file(metadata["filename"]):
+                return TusResponse(status=409, reason="File with same name already exists")
+            try:
+                file_size = int(upload.get("length", 0))
+            except (TypeError, ValueError):
+                return TusResponse(status=400, reason="Invalid upload length")
+            response = self.check_file_size(file_size)
+            if response is not None:
+                return response
+            specs.append((metadata, file_size))
+
+        if not get_upload_storage().has_space(sum(file_size for metadata, file_size in specs)):
+            return TusResponse(status=507, reason="Not enough space for the uploads")
+
+        try:
+            tus_files = TusFile.create_initial_files(specs, client_key=get_client_key(request))
+        except UploadCreationError as e:
+            return e.response
+
+        upload_url = request.build_absolute_uri(reverse(self.upload_url_name))
+        return TusResponse(
+            status=201, content_type='application/json',
+            content=json.dumps({
+                'locations': ['{}{}'.format(upload_url, tus_file.resource_id) for tus_file in tus_files],
+                'expires': http_date(min((tus_file.expires for tus_file in tus_files), default=0)),
+            }))
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class TusUploadStatus(View):
+    """
+    Returns the state of many uploads at once, so that a client resuming a
+    lot of uploads needs a single request instead of a HEAD per upload.
+
+    The request body is a JSON list of resource ids, the response maps every
+    resource id to its `offset`, `length` and `expires`, or `null` if the
+    upload doesn't exist.
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            resource_ids = json.loads(request.body.decode())
+        except ValueError:
+            return TusResponse(status=400, reason="Invalid JSON")
+        if not isinstance(resource_ids, list) or not all(isinstance(r, str) for r in resource_ids):
+            return TusResponse(status=400, reason="Expected a list of resource ids")
+        if len(resource_ids) > settings.TUS_BULK_MAX_UPLOADS:
+            return TusResponse(status=413, reason="Too many uploads")
+
+        states = get_state_store().get_many(resource_ids)
+        return self.status_response(resource_ids, states)
+
+    @staticmethod
+    def status_response(resource_ids, states):
+        status = {}
+        for resource_id in resource_ids:
+            state = states.get(resource_id)
+            status[resource_id] = None if state is None else {
+                'offset': state.offset,
+                'length': state.file_size,
+                'expires': http_date(state.expires),
+            }
+        return TusResponse(status=200, content=json.dumps(status), content_type='application/json')
+
+
+class AsyncTusUpload(TusUpload):
+    """
+    An async variant of `TusUpload` for ASGI deployments.
+
+    Under ASGI the request body is received by the event loop before the view
+    runs, so a slow client doesn't occupy a thread while it sends a chunk. The
+    state lookups and the upload lock use the async cache API, and the
+    blocking file I/O runs in a thread pool of `TUS_ASYNC_WORKERS` threads.
+    """
+
+    @classonlymethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+
+        async def async_view(request, *args, **kwargs):
+            # dispatch() returns plain responses for rejected requests.
+            response = view(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+            return response
+
+        return update_wrapper(async_view, view)
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+    async def post(self, request, *args, **kwargs):
+        return await run_blocking(super().post, request, *args, **kwargs)
+
+    async def head(self, request, resource_id):
+        state = await get_state_store().aget(str(resource_id))
+        if state is None:
+            raise Tus404()
+
+        return self.head_response(TusFile(str(resource_id), state))
+
+    async def get(self, request, resource_id):
+        state = await get_state_store().aget(str(resource_id))
+        if state is None:
+            raise Tus404()
+
+        return self.status_response(TusFile(str(resource_id), state))
+
+    async def patch(self, request, resource_id, *args, **kwargs):
+        lock = UploadLock(str(resource_id))
+        if not await lock.aacquire():
+            return TusResponse(status=423, reason="Upload is locked by another request")
+
+        try:
+            return await run_blocking(self.write_locked_chunk, request, resource_id, lock)
+        finally:
+            await lock.arelease()
+
+    async def delete(self, request, resource_id, *args, **kwargs):
+        return await run_blocking(super().delete, request, resource_id, *args, **kwargs)
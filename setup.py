@@ -49,6 +49,9 @@ setup(
         'django-appconf',
         'pathvalidate==2.3.0'
     ],
+    extras_require={
+        's3': ['boto3'],
+    },
     license="MIT",
     long_description_content_type='text/x-rst',
     zip_safe=False,
@@ -0,0 +1,77 @@
+import os
+import time
+
+from django.core.management import call_command
+
+from django_tus.tusfile import TusFile
+
+
+class TestReap(object):
+
+    def test_orphaned_files_are_deleted(self, capsys):
+        active = TusFile.create_initial_file({'filename': 'active.txt'}, 10)
+        orphan = TusFile.create_initial_file({'filename': 'orphan.txt'}, 10)
+        orphan.clean()
+        for tus_file in (active, orphan):
+            os.utime(tus_file.get_path(), (time.time() - 3600, time.time() - 3600))
+
+        call_command('tus_reap', '--dry-run')
+        assert os.path.exists(orphan.get_path())
+        assert 'Would delete {}'.format(orphan.get_path()) in capsys.readouterr().out
+
+        call_command('tus_reap')
+        assert not os.path.exists(orphan.get_path())
+        assert os.path.exists(active.get_path())
+
+        active.remove()
+        active.clean()
+
+    def test_recent_files_are_kept(self):
+        orphan = TusFile.create_initial_file({'filename': 'orphan.txt'}, 10)
+        orphan.clean()
+
+        call_command('tus_reap')
+        assert os.path.exists(orphan.get_path())
+        orphan.remove()
+
+
+class TestRecover(object):
+
+    def test_offsets_are_rewound_to_the_journal(self, settings):
+        from django.core.cache import cache
+        from django_tus.state import get_state_store
+        settings.TUS_STATE_STORE = 'django_tus.state.JournaledStateStore'
+
+        tus_file = TusFile.create_initial_file({'filename': 'hello.txt'}, 10)
+        store = get_state_store()
+        store.incr_offset(tus_file.resource_id, 4)
+        # A crash between advancing the cached offset and the journal.
+        cache.incr(store.offset_key(tus_file.resource_id), 4)
+
+        gone = TusFile.create_initial_file({'filename': 'gone.txt'}, 10)
+        gone.remove()
+
+        call_command('tus_recover')
+
+        assert store.get(tus_file.resource_id).offset == 4
+        assert store.get(gone.resource_id) is None
+        tus_file.terminate()
+
+
+class TestShard(object):
+
+    def test_flat_uploads_are_moved_into_shards(self, settings, capsys):
+        tus_file = TusFile.create_initial_file({'filename': 'flat.txt'}, 10)
+        flat_path = tus_file.get_path()
+        settings.TUS_UPLOAD_SHARD_DEPTH = 1
+
+        call_command('tus_shard', '--dry-run')
+        assert os.path.exists(flat_path)
+        assert '{} -> '.format(flat_path) in capsys.readouterr().out
+
+        call_command('tus_shard')
+        assert not os.path.exists(flat_path)
+        assert tus_file.get_path() == os.path.join(
+            settings.TUS_UPLOAD_DIR, tus_file.resource_id[:2], tus_file.resource_id)
+        assert os.path.exists(tus_file.get_path())
+        tus_file.terminate()
@@ -66,3 +66,18 @@ class TestConfigErrors(object):
     def test_unconfigured_destination_dir(self, settings_without_media_root):
         errors = django_tus_config_check(['django_tus'])
         assert errors == [BAD_CONFIG_ERROR_TUS_DESTINATION_DIR]
+
+    def test_deduplicate_requires_sha256_digest(self, settings):
+        from django_tus.errors import BAD_CONFIG_ERROR_TUS_DEDUPLICATE
+        settings.TUS_DEDUPLICATE = 'hardlink'
+        assert BAD_CONFIG_ERROR_TUS_DEDUPLICATE in django_tus_config_check(['django_tus'])
+
+        settings.TUS_UPLOAD_DIGEST = 'sha256'
+        assert BAD_CONFIG_ERROR_TUS_DEDUPLICATE not in django_tus_config_check(['django_tus'])
+
+    def test_directories_on_different_filesystems(self, monkeypatch):
+        from django_tus import apps
+        assert 'django-tus.W001' not in [error.id for error in django_tus_config_check(['django_tus'])]
+
+        monkeypatch.setattr(apps, 'same_filesystem', lambda *paths: False)
+        assert 'django-tus.W001' in [error.id for error in django_tus_config_check(['django_tus'])]
@@ -0,0 +1,50 @@
+import threading
+
+from django_tus import durability
+from django_tus.apps import django_tus_config_check
+from django_tus.errors import BAD_CONFIG_ERROR_TUS_DURABILITY
+
+
+class TestGroupCommitter(object):
+
+    def test_concurrent_syncs_share_one_batch(self, monkeypatch):
+        synced = []
+        monkeypatch.setattr(durability, 'fdatasync', lambda fd: synced.append((fd, threading.current_thread())))
+        committer = durability.GroupCommitter(window=0.2)
+
+        threads = [threading.Thread(target=committer.sync, args=(fd,)) for fd in (10, 11, 12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # All files were synced by the first writer.
+        assert sorted(fd for fd, thread in synced) == [10, 11, 12]
+        assert len({thread for fd, thread in synced}) == 1
+
+    def test_sync_errors_are_raised_to_their_writer(self, monkeypatch):
+        def failing(fd):
+            raise OSError('disk on fire')
+        monkeypatch.setattr(durability, 'fdatasync', failing)
+
+        try:
+            durability.GroupCommitter(window=0).sync(10)
+        except OSError as e:
+            assert str(e) == 'disk on fire'
+        else:
+            assert False, 'OSError not raised'
+
+
+class TestDurabilitySetting(object):
+
+    def test_per_chunk_mode_syncs_every_chunk(self, settings, monkeypatch):
+        settings.TUS_DURABILITY = 'fdatasync-per-chunk'
+        synced = []
+        monkeypatch.setattr(durability, 'fdatasync', synced.append)
+
+        durability.sync_chunk(10)
+        assert synced == [10]
+
+    def test_unknown_mode_is_a_config_error(self, settings):
+        settings.TUS_DURABILITY = 'sometimes'
+        assert BAD_CONFIG_ERROR_TUS_DURABILITY in django_tus_config_check(['django_tus'])
@@ -0,0 +1,79 @@
+import os
+
+from django_tus.fdpool import FileDescriptorPool
+
+
+def is_open(fd):
+    try:
+        os.fstat(fd)
+    except OSError:
+        return False
+    return True
+
+
+class TestFileDescriptorPool(object):
+
+    def test_descriptors_are_reused(self, tmp_path):
+        pool = FileDescriptorPool(max_size=2, idle_timeout=60)
+        (tmp_path / 'a').write_bytes(b'')
+
+        fd = pool.acquire('a', str(tmp_path / 'a'))
+        pool.release('a')
+        assert pool.acquire('a', str(tmp_path / 'a')) == fd
+        pool.release('a')
+
+        pool.evict('a')
+        assert 'a' not in pool
+        assert not is_open(fd)
+
+    def test_least_recently_used_descriptors_are_closed(self, tmp_path):
+        pool = FileDescriptorPool(max_size=1, idle_timeout=60)
+        for name in ('a', 'b'):
+            (tmp_path / name).write_bytes(b'')
+
+        fd_a = pool.acquire('a', str(tmp_path / 'a'))
+        pool.release('a')
+        pool.acquire('b', str(tmp_path / 'b'))
+        pool.release('b')
+
+        assert 'a' not in pool and 'b' in pool
+        assert not is_open(fd_a)
+        pool.evict('b')
+
+    def test_descriptors_in_use_are_closed_on_release(self, tmp_path):
+        pool = FileDescriptorPool(max_size=1, idle_timeout=0)
+        (tmp_path / 'a').write_bytes(b'')
+
+        fd = pool.acquire('a', str(tmp_path / 'a'))
+        pool.evict('a')
+        assert is_open(fd)
+
+        pool.release('a')
+        assert not is_open(fd)
+
+    def test_idle_descriptors_are_closed_on_acquire(self, tmp_path):
+        pool = FileDescriptorPool(max_size=2, idle_timeout=60)
+        for name in ('a', 'b'):
+            (tmp_path / name).write_bytes(b'')
+
+        fd_a = pool.acquire('a', str(tmp_path / 'a'))
+        pool.release('a')
+        pool._idle_timeout = 0
+        fd_b = pool.acquire('b', str(tmp_path / 'b'))
+
+        assert 'a' not in pool and 'b' in pool
+        assert not is_open(fd_a) and is_open(fd_b)
+        pool.release('b')
+
+    def test_evict_idle(self, tmp_path):
+        pool = FileDescriptorPool(max_size=2, idle_timeout=60)
+        (tmp_path / 'a').write_bytes(b'')
+
+        fd = pool.acquire('a', str(tmp_path / 'a'))
+        pool.release('a')
+        pool.evict_idle()
+        assert is_open(fd)
+
+        pool._idle_timeout = 0
+        pool.evict_idle()
+        assert 'a' not in pool and not is_open(fd)
@@ -0,0 +1,65 @@
+import errno
+import os
+
+import pytest
+
+from django_tus import fileutils
+
+
+class TestMoveFile(object):
+
+    def test_move_across_filesystems_copies(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(fileutils, 'same_filesystem', lambda *paths: False)
+        src = tmp_path / 'src'
+        src.write_bytes(b'x' * 100)
+        progress = []
+
+        fileutils.move_file(str(src), str(tmp_path / 'dst'), progress=lambda copied, total: progress.append(copied))
+
+        assert not src.exists()
+        assert (tmp_path / 'dst').read_bytes() == b'x' * 100
+        assert progress == [100]
+
+    def test_copy_is_synced_before_the_source_is_deleted(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(fileutils, 'same_filesystem', lambda *paths: False)
+        src = tmp_path / 'src'
+        src.write_bytes(b'x' * 100)
+        syncs = []
+
+        def fsync(fd):
+            assert src.exists() and not (tmp_path / 'dst').exists()
+            syncs.append(os.fstat(fd).st_size)
+        monkeypatch.setattr(fileutils.os, 'fsync', fsync)
+
+        fileutils.move_file(str(src), str(tmp_path / 'dst'), sync=True)
+
+        assert syncs == [100]
+        assert not src.exists()
+
+    def test_cancelled_copy_leaves_source_alone(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(fileutils, 'same_filesystem', lambda *paths: False)
+        src = tmp_path / 'src'
+        src.write_bytes(b'x' * 100)
+
+        def cancel(copied, total):
+            raise RuntimeError('cancelled')
+
+        with pytest.raises(RuntimeError):
+            fileutils.move_file(str(src), str(tmp_path / 'dst'), progress=cancel)
+
+        assert src.exists()
+        assert os.listdir(str(tmp_path)) == ['src']
+
+
+class TestCopyRange(object):
+
+    def test_falls_back_when_kernel_copy_is_unsupported(self, tmp_path, monkeypatch):
+        def unsupported(*args):
+            raise OSError(errno.EXDEV, 'cross-device')
+        monkeypatch.setattr(os, 'copy_file_range', unsupported, raising=False)
+        monkeypatch.setattr(os, 'sendfile', unsupported, raising=False)
+
+        (tmp_path / 'src').write_bytes(b'0123456789')
+        fileutils.copy_file(str(tmp_path / 'src'), str(tmp_path / 'dst'))
+
+        assert (tmp_path / 'dst').read_bytes() == b'0123456789'
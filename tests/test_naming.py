@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from django_tus.naming import FilenameGenerator
+
+
+@pytest.fixture()
+def destination_dir(settings, tmp_path):
+    settings.TUS_DESTINATION_DIR = str(tmp_path)
+    return tmp_path
+
+
+class TestIncrementedName(object):
+
+    def test_names_continue_after_existing_files(self, destination_dir):
+        for index in (1, 2, 7):
+            (destination_dir / 'photo.{:04d}.jpg'.format(index)).write_bytes(b'')
+        (destination_dir / 'photo.0009.png').write_bytes(b'')
+
+        assert FilenameGenerator('photo.jpg').create_incremented_name() == 'photo.0008.jpg'
+        assert FilenameGenerator('photo.jpg').create_incremented_name() == 'photo.0009.jpg'
+        assert FilenameGenerator('photo.png').create_incremented_name() == 'photo.0010.png'
+
+    def test_names_are_reserved(self, destination_dir):
+        filename = FilenameGenerator('report.pdf').create_incremented_name()
+        assert os.path.exists(str(destination_dir / filename))
+
+    def test_names_taken_behind_the_index_are_skipped(self, destination_dir):
+        assert FilenameGenerator('notes.txt').create_incremented_name() == 'notes.0001.txt'
+        (destination_dir / 'notes.0002.txt').write_bytes(b'')
+
+        assert FilenameGenerator('notes.txt').create_incremented_name() == 'notes.0003.txt'
@@ -0,0 +1,96 @@
+import pytest
+
+from django_tus.state import CacheStateStore, JournaledStateStore, UploadState
+
+
+class TestCacheStateStore(object):
+
+    def test_state_round_trip(self):
+        store = CacheStateStore()
+        store.create(UploadState('state-1', 'hello.txt', 11, {'filename': 'hello.txt'}))
+
+        assert store.incr_offset('state-1', 5) == 5
+
+        state = store.get('state-1')
+        assert (state.filename, state.file_size, state.metadata, state.offset) == \
+            ('hello.txt', 11, {'filename': 'hello.txt'}, 5)
+
+        store.delete('state-1')
+        assert store.get('state-1') is None
+
+    def test_get_many_skips_unknown_uploads(self):
+        store = CacheStateStore()
+        store.create(UploadState('state-2', 'a.txt', 1))
+        store.create(UploadState('state-3', 'b.txt', 2))
+
+        states = store.get_many(['state-2', 'state-3', 'unknown'])
+        assert sorted(states) == ['state-2', 'state-3']
+
+        store.delete('state-2')
+        store.delete('state-3')
+
+    def test_incr_offset_from_stale_offset_conflicts(self):
+        from django_tus.state import OffsetConflict
+        store = CacheStateStore()
+        store.create(UploadState('state-4', 'hello.txt', 10))
+        assert store.incr_offset('state-4', 5, expected=0) == 5
+
+        with pytest.raises(OffsetConflict):
+            store.incr_offset('state-4', 5, expected=0)
+        assert store.get('state-4').offset == 5
+        store.delete('state-4')
+
+
+class TestJournaledStateStore(object):
+
+    def test_state_survives_cache_flush(self):
+        from django.core.cache import cache
+        store = JournaledStateStore()
+        store.create(UploadState('journal-1', 'hello.txt', 11, {'filename': 'hello.txt'}))
+        store.incr_offset('journal-1', 5)
+
+        cache.clear()
+        state = store.get('journal-1')
+        assert (state.filename, state.file_size, state.offset) == ('hello.txt', 11, 5)
+
+        cache.clear()
+        assert store.incr_offset('journal-1', 6) == 11
+        assert store.read_journal('journal-1').offset == 11
+
+        store.delete('journal-1')
+        cache.clear()
+        assert store.get('journal-1') is None
+
+    def test_rebuild_neither_writes_journal_nor_overwrites_cache(self, monkeypatch):
+        from django.core.cache import cache
+        store = JournaledStateStore()
+        store.create(UploadState('journal-2', 'hello.txt', 11))
+        store.incr_offset('journal-2', 5)
+        cache.delete(store.record_key('journal-2'))
+        # A PATCH advanced the cached offset ahead of the journal.
+        cache.incr(store.offset_key('journal-2'), 3)
+
+        def no_journal_writes(state):
+            raise AssertionError('journal rewritten')
+        monkeypatch.setattr(store, 'write_journal', no_journal_writes)
+
+        assert store.get('journal-2').offset == 8
+        assert cache.get(store.offset_key('journal-2')) == 8
+        monkeypatch.undo()
+        store.delete('journal-2')
+
+    @pytest.mark.parametrize('durability, synced', [('none', False), ('fdatasync-per-chunk', True)])
+    def test_offset_is_synced_according_to_durability(self, settings, monkeypatch, durability, synced):
+        from django_tus import durability as durability_module
+        settings.TUS_DURABILITY = durability
+        store = JournaledStateStore()
+        store.create(UploadState('journal-3', 'hello.txt', 11))
+
+        syncs = []
+        monkeypatch.setattr(durability_module, 'fdatasync', syncs.append)
+        store.incr_offset('journal-3', 5)
+        monkeypatch.undo()
+
+        assert bool(syncs) == synced
+        assert store.read_journal('journal-3').offset == 5
+        store.delete('journal-3')
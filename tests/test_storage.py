@@ -0,0 +1,185 @@
+import io
+import os
+
+import pytest
+
+from django_tus.storage import S3MultipartUploadStorage
+from django_tus.tusfile import TusChunk, TusFile
+from tests.test_tusfile import FakeRequest
+
+
+class FakeS3Client(object):
+    """
+    An in-memory stand-in for the parts of the boto3 S3 client used by
+    S3MultipartUploadStorage.
+    """
+
+    class exceptions(object):
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = 'upload-{}'.format(len(self.uploads))
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': 'etag-{}'.format(PartNumber)}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b''.join(parts[part['PartNumber']] for part in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        del self.uploads[UploadId]
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise self.exceptions.NoSuchKey(Key)
+        return {'Body': io.BytesIO(self.objects[Key])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop(Key, None)
+
+
+@pytest.fixture()
+def s3_storage(monkeypatch):
+    storage = S3MultipartUploadStorage(client=FakeS3Client(), bucket='uploads', prefix='tus/', part_size=4)
+    monkeypatch.setattr(TusFile, 'get_storage', lambda self: storage)
+    return storage
+
+
+def write(tus_file, data):
+    return tus_file.write_chunk(TusChunk(FakeRequest(data, offset=tus_file.offset)))
+
+
+class TestS3MultipartUploadStorage(object):
+
+    def test_chunks_are_streamed_into_parts(self, s3_storage):
+        tus_file = TusFile.create_initial_file({'filename': 'hello.txt'}, 11)
+        write(tus_file, b'hel')
+        write(tus_file, b'lo wor')
+        assert s3_storage.size(tus_file) == 9
+        write(tus_file, b'ld')
+
+        tus_file.rename()
+        tus_file.clean()
+
+        key = 'tus/{}/hello.txt'.format(tus_file.resource_id)
+        assert tus_file.filename == key
+        assert s3_storage.client.objects == {key: b'hello world'}
+
+    def test_failed_commit_keeps_the_previous_tail(self, s3_storage, monkeypatch):
+        tus_file = TusFile.create_initial_file({'filename': 'hello.txt'}, 11)
+        write(tus_file, b'hel')
+
+        def broken_save_upload(tus_file, upload):
+            raise ConnectionError('cache is down')
+        monkeypatch.setattr(s3_storage, 'save_upload', broken_save_upload)
+        assert write(tus_file, b'lo').status_code == 500
+        monkeypatch.delattr(s3_storage, 'save_upload')
+
+        # The client resumes from the offset it got last.
+        write(tus_file, b'lo world')
+        tus_file.rename()
+        tus_file.clean()
+        assert s3_storage.client.objects[tus_file.filename] == b'hello world'
+
+    def test_upload_survives_cache_flush(self, s3_storage):
+        from django.core.cache import cache
+        tus_file = TusFile.create_initial_file({'filename': 'hello.txt'}, 11)
+        write(tus_file, b'hello ')
+        cache.delete(s3_storage.upload_key(tus_file))
+
+        assert tus_file.is_valid()
+        write(tus_file, b'world')
+        tus_file.rename()
+        tus_file.clean()
+        assert s3_storage.client.objects == {tus_file.filename: b'hello world'}
+
+    def test_abort_discards_multipart_upload(self, s3_storage):
+        tus_file = TusFile.create_initial_file({'filename': 'hello.txt'}, 11)
+        write(tus_file, b'hello')
+        tus_file.terminate()
+
+        assert s3_storage.client.uploads == {}
+        assert s3_storage.client.objects == {}
+        assert not tus_file.is_valid()
+
+
+class TestShardedLayout(object):
+
+    def test_partial_and_finished_files_are_sharded(self, settings):
+        settings.TUS_UPLOAD_SHARD_DEPTH = 2
+        settings.TUS_DESTINATION_SHARD_DEPTH = 1
+        settings.TUS_FILE_NAME_FORMAT = 'increment'
+
+        tus_file = TusFile.create_initial_file({'filename': 'sharded.txt'}, 4)
+        shards = tus_file.resource_id[:2], tus_file.resource_id[2:4]
+        assert tus_file.get_path() == os.path.join(settings.TUS_UPLOAD_DIR, *shards, tus_file.resource_id)
+        write(tus_file, b'data')
+
+        tus_file.rename()
+        tus_file.clean()
+        subdir, filename = os.path.split(tus_file.filename)
+        assert len(subdir) == 2 and filename.startswith('sharded.')
+        path = os.path.join(settings.TUS_DESTINATION_DIR, tus_file.filename)
+        with open(path, 'rb') as f:
+            assert f.read() == b'data'
+        os.remove(path)
+
+
+class TestPreallocation(object):
+
+    @pytest.mark.parametrize('mode, size', [('sparse', 10), ('posix_fallocate', 10), ('none', 0)])
+    def test_file_size_depends_on_mode(self, settings, mode, size):
+        settings.TUS_PREALLOCATION = mode
+        tus_file = TusFile.create_initial_file({'filename': 'prealloc.txt'}, 10)
+        assert os.path.getsize(tus_file.get_path()) == size
+        tus_file.terminate()
+
+    def test_reservations_follow_the_written_bytes(self, settings):
+        from django_tus.space import space_reservations
+        settings.TUS_PREALLOCATION = 'none'
+        before = space_reservations.value()
+
+        tus_file = TusFile.create_initial_file({'filename': 'reserved.txt'}, 10)
+        assert space_reservations.value() == before + 10
+        write(tus_file, b'hello')
+        assert space_reservations.value() == before + 5
+        tus_file.terminate()
+        assert space_reservations.value() == before
+
+    @pytest.mark.parametrize('mode, size', [('sparse', 10), ('none', 0)])
+    def test_discarded_bytes_are_not_kept(self, settings, mode, size):
+        settings.TUS_PREALLOCATION = mode
+        tus_file = TusFile.create_initial_file({'filename': 'discarded.txt'}, 10)
+
+        with tus_file.get_storage().open(tus_file, 0) as writer:
+            writer.write(b'hello')
+        assert os.path.getsize(tus_file.get_path()) == size
+        tus_file.terminate()
+
+    def test_pooled_uploads_are_not_stated(self, settings, monkeypatch):
+        settings.TUS_PREALLOCATION = 'none'
+        tus_file = TusFile.create_initial_file({'filename': 'pooled.txt'}, 10)
+        write(tus_file, b'hello')
+
+        def no_stat(path):
+            raise AssertionError('stat on every chunk')
+        monkeypatch.setattr(os.path, 'lexists', no_stat)
+        monkeypatch.setattr(os, 'fstat', no_stat)
+        assert tus_file.is_valid()
+        write(tus_file, b'world')
+        monkeypatch.undo()
+
+        assert os.path.getsize(tus_file.get_path()) == 10
+        tus_file.terminate()
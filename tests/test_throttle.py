@@ -0,0 +1,35 @@
+from django_tus.throttle import TokenBucket, bandwidth_limiter
+
+
+class TestTokenBucket(object):
+
+    def test_burst_passes_and_debt_is_waited_off(self):
+        bucket = TokenBucket(rate=100)
+        assert bucket.take(100) == 0
+        assert 0.49 < bucket.take(50) <= 0.5
+
+
+class TestBandwidthLimiter(object):
+
+    def test_buckets_are_kept_per_upload(self, settings):
+        settings.TUS_UPLOAD_BANDWIDTH_LIMIT = 4
+        bucket = bandwidth_limiter.get_buckets('one')[0]
+        assert bandwidth_limiter.get_buckets('one') == [bucket]
+        assert bandwidth_limiter.get_buckets('other') != [bucket]
+
+    def test_nothing_is_shaped_by_default(self):
+        assert bandwidth_limiter.get_buckets('one', 'client') == []
+
+    def test_lock_is_renewed_while_waiting(self):
+        class FakeLock(object):
+            timeout = 0.4
+            renewals = 0
+
+            def renew(self):
+                self.renewals += 1
+
+        bucket = TokenBucket(rate=100)
+        bucket.take(100)
+        lock = FakeLock()
+        bandwidth_limiter.consume([bucket], 30, lock=lock)
+        assert lock.renewals >= 3
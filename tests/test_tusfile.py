@@ -0,0 +1,80 @@
+import io
+import os
+
+import pytest
+
+from django_tus.state import get_state_store
+from django_tus.tusfile import TusChunk, TusFile
+
+
+class FakeRequest(object):
+
+    def __init__(self, content, offset=0, content_length=None, fail_after=None):
+        self.META = {
+            'HTTP_UPLOAD_OFFSET': str(offset),
+            'CONTENT_LENGTH': str(len(content) if content_length is None else content_length),
+        }
+        self._stream = io.BytesIO(content)
+        self._fail_after = fail_after
+        self.reads = []
+
+    def read(self, size):
+        from django.http.request import UnreadablePostError
+        if self._fail_after is not None and self._stream.tell() >= self._fail_after:
+            raise UnreadablePostError('connection reset')
+        self.reads.append(size)
+        return self._stream.read(size)
+
+
+@pytest.fixture()
+def tus_file(settings):
+    settings.TUS_CHUNK_BUFFER_SIZE = 4
+    tus_file = TusFile.create_initial_file({'filename': 'hello.txt'}, 10)
+    yield tus_file
+    tus_file.clean()
+    if os.path.lexists(tus_file.get_path()):
+        os.remove(tus_file.get_path())
+
+
+class TestWriteChunk(object):
+
+    def test_body_is_streamed_in_blocks(self, tus_file):
+        request = FakeRequest(b'0123456789')
+        tus_file.write_chunk(TusChunk(request))
+
+        assert max(request.reads) == 4
+        assert tus_file.offset == 10
+        with open(tus_file.get_path(), 'rb') as f:
+            assert f.read() == b'0123456789'
+
+    def test_disconnect_persists_received_bytes(self, tus_file):
+        chunk = TusChunk(FakeRequest(b'0123456789', fail_after=8))
+        tus_file.write_chunk(chunk)
+
+        assert chunk.interrupted
+        assert tus_file.offset == 8
+
+    def test_writes_are_shaped_by_bandwidth_limit(self, tus_file, settings, monkeypatch):
+        from django_tus import throttle
+        settings.TUS_UPLOAD_BANDWIDTH_LIMIT = 4
+        sleeps = []
+        monkeypatch.setattr(throttle.time, 'sleep', sleeps.append)
+
+        tus_file.write_chunk(TusChunk(FakeRequest(b'0123456789')))
+
+        assert tus_file.offset == 10
+        # The first block is the burst, the other 6 bytes are owed for 1.5s.
+        assert 1.4 < max(sleeps) <= 1.5
+
+    def test_chunk_is_not_committed_after_losing_the_lock(self, tus_file, settings):
+        from django.core.cache import cache
+        from django_tus.locks import UploadLock
+        lock = UploadLock(tus_file.resource_id)
+        assert lock.acquire()
+        # The lease expired and another request took the lock.
+        cache.set(lock.key, 'someone else')
+
+        response = tus_file.write_chunk(TusChunk(FakeRequest(b'0123456789')), lock=lock)
+
+        assert response.status_code == 409
+        assert get_state_store().get(tus_file.resource_id).offset == 0
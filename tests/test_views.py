@@ -1,3 +1,10 @@
+import base64
+import hashlib
+import json
+import os
+import time
+
+import pytest
 from django.urls import reverse
 from tusclient.client import TusClient
 
@@ -15,3 +22,505 @@ class TestUploadView(object):
         uploader = tus_client.uploader('tests/files/hello_world.txt', chunk_size=200)
         uploader.upload()
         assert uploader.request.status_code == 204
+
+
+@pytest.fixture
+def finished_uploads():
+    """
+    The keyword arguments of the `tus_upload_finished_signal` sent while the
+    test runs.
+    """
+    from django_tus.signals import tus_upload_finished_signal
+    finished = []
+
+    def receiver(sender, **kwargs):
+        finished.append(kwargs)
+    tus_upload_finished_signal.connect(receiver)
+    yield finished
+    tus_upload_finished_signal.disconnect(receiver)
+
+
+def create_upload(client, length, **extra):
+    response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_LENGTH=str(length), **extra)
+    assert response.status_code == 201
+    return response['Location'].rsplit('/', 1)[-1]
+
+
+def patch_upload(client, resource_id, data, offset=0, **extra):
+    return client.generic(
+        'PATCH', reverse('tus_upload_chunks', kwargs={'resource_id': resource_id}), data,
+        content_type='application/offset+octet-stream', HTTP_TUS_RESUMABLE='1.0.0',
+        HTTP_UPLOAD_OFFSET=str(offset), **extra)
+
+
+class TestCreation(object):
+
+    def test_upload_exceeding_free_space_is_rejected(self, client, monkeypatch):
+        from django_tus import storage
+        monkeypatch.setattr(storage, 'free_space', lambda path: 1024)
+
+        response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_LENGTH='2048')
+        assert response.status_code == 507
+
+    def test_upload_exceeding_max_size_is_rejected(self, client, settings):
+        settings.TUS_MAX_FILE_SIZE = 100
+        response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_LENGTH='101')
+        assert response.status_code == 413
+
+    def test_active_uploads_are_limited_per_client(self, client, settings):
+        settings.TUS_MAX_ACTIVE_UPLOADS_PER_CLIENT = 1
+        resource_id = create_upload(client, 10)
+
+        response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_LENGTH='10')
+        assert response.status_code == 429
+
+        client.delete(reverse('tus_upload_chunks', kwargs={'resource_id': resource_id}), HTTP_TUS_RESUMABLE='1.0.0')
+        resource_id = create_upload(client, 5)
+        patch_upload(client, resource_id, b'hello')
+        create_upload(client, 10)
+
+
+class TestPatch(object):
+
+    def test_taken_name_fails_the_last_patch(self, client, settings):
+        settings.TUS_FILE_NAME_FORMAT = 'keep'
+        settings.TUS_EXISTING_FILE = 'overwrite'
+        resource_id = create_upload(client, 5, HTTP_UPLOAD_METADATA='filename {}'.format(
+            base64.b64encode(b'taken.txt').decode()))
+        path = os.path.join(settings.TUS_DESTINATION_DIR, 'taken.txt')
+        with open(path, 'wb') as f:
+            f.write(b'first')
+
+        try:
+            assert patch_upload(client, resource_id, b'hello').status_code == 409
+            with open(path, 'rb') as f:
+                assert f.read() == b'first'
+            assert not os.path.exists(os.path.join(settings.TUS_UPLOAD_DIR, resource_id))
+        finally:
+            os.remove(path)
+
+    def test_locked_upload_is_rejected(self, client):
+        from django_tus.locks import UploadLock
+
+        resource_id = create_upload(client, 5)
+        with UploadLock(resource_id):
+            response = patch_upload(client, resource_id, b'hello')
+        assert response.status_code == 423
+
+        response = patch_upload(client, resource_id, b'hello')
+        assert response.status_code == 204
+        assert response['Upload-Offset'] == '5'
+
+    def test_stale_offset_is_rejected(self, client):
+        resource_id = create_upload(client, 10)
+        assert patch_upload(client, resource_id, b'hello').status_code == 204
+
+        response = patch_upload(client, resource_id, b'hello', offset=0)
+        assert response.status_code == 409
+
+
+class TestCreationWithUpload(object):
+
+    def test_body_completing_the_upload_is_finished_right_away(self, client, settings):
+        response = client.post(
+            reverse('tus_upload'), b'hello', content_type='application/offset+octet-stream',
+            HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_LENGTH='5',
+            HTTP_UPLOAD_METADATA='filename {}'.format(base64.b64encode(b'created.txt').decode()))
+        assert response.status_code == 201
+        assert response['Upload-Offset'] == '5'
+
+        path = os.path.join(settings.TUS_DESTINATION_DIR, 'created.0001.txt')
+        with open(path, 'rb') as f:
+            assert f.read() == b'hello'
+        os.remove(path)
+
+    def test_upload_is_resumed_after_the_body(self, client):
+        response = client.post(
+            reverse('tus_upload'), b'hello', content_type='application/offset+octet-stream',
+            HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_LENGTH='11')
+        assert response.status_code == 201
+        assert response['Upload-Offset'] == '5'
+
+        resource_id = response['Location'].rsplit('/', 1)[-1]
+        response = patch_upload(client, resource_id, b' world', offset=5)
+        assert response.status_code == 204
+        assert response['Upload-Offset'] == '11'
+
+    def test_upload_is_terminated_when_the_body_fails(self, client, settings, monkeypatch):
+        from django_tus.response import TusResponse
+        from django_tus.tusfile import TusFile
+        monkeypatch.setattr(TusFile, 'write_chunk', lambda self, chunk, lock=None: TusResponse(status=500))
+        uploads = set(os.listdir(settings.TUS_UPLOAD_DIR))
+
+        response = client.post(
+            reverse('tus_upload'), b'hello', content_type='application/offset+octet-stream',
+            HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_LENGTH='11')
+        assert response.status_code == 500
+        assert set(os.listdir(settings.TUS_UPLOAD_DIR)) == uploads
+
+    def test_upload_is_created_when_locked(self, client, monkeypatch):
+        from django_tus.locks import UploadLock
+        monkeypatch.setattr(UploadLock, 'acquire', lambda self: False)
+
+        response = client.post(
+            reverse('tus_upload'), b'hello', content_type='application/offset+octet-stream',
+            HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_LENGTH='11')
+        assert response.status_code == 201
+        assert response['Upload-Offset'] == '0'
+
+
+class TestDeferLength(object):
+
+    def test_length_is_declared_by_a_later_patch(self, client, settings, finished_uploads):
+        response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_DEFER_LENGTH='1')
+        assert response.status_code == 201
+        resource_id = response['Location'].rsplit('/', 1)[-1]
+        url = reverse('tus_upload_chunks', kwargs={'resource_id': resource_id})
+
+        assert patch_upload(client, resource_id, b'hello').status_code == 204
+        response = client.head(url, HTTP_TUS_RESUMABLE='1.0.0')
+        assert response['Upload-Defer-Length'] == '1'
+        assert 'Upload-Length' not in response
+
+        response = patch_upload(client, resource_id, b' world', offset=5, HTTP_UPLOAD_LENGTH='11')
+        assert response.status_code == 204
+        assert finished_uploads[0]['file_size'] == 11
+        with open(os.path.join(settings.TUS_DESTINATION_DIR, finished_uploads[0]['filename']), 'rb') as f:
+            assert f.read() == b'hello world'
+
+    def test_invalid_defer_length_is_rejected(self, client):
+        response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_DEFER_LENGTH='2')
+        assert response.status_code == 400
+
+    def test_length_below_offset_is_rejected(self, client):
+        response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0', HTTP_UPLOAD_DEFER_LENGTH='1')
+        resource_id = response['Location'].rsplit('/', 1)[-1]
+        patch_upload(client, resource_id, b'hello')
+
+        response = patch_upload(client, resource_id, b'', offset=5, HTTP_UPLOAD_LENGTH='4')
+        assert response.status_code == 400
+
+
+class TestUploadStatus(object):
+
+    def test_state_of_many_uploads_is_returned(self, client):
+        resource_ids = [create_upload(client, 10), create_upload(client, 20)]
+        patch_upload(client, resource_ids[0], b'hello')
+
+        response = client.post(reverse('tus_upload_status'), json.dumps(resource_ids + ['unknown']),
+                               content_type='application/json')
+        assert response.status_code == 200
+        status = json.loads(response.content.decode())
+        assert status[resource_ids[0]]['offset'] == 5
+        assert status[resource_ids[1]]['length'] == 20
+        assert status['unknown'] is None
+
+    def test_malformed_body_is_rejected(self, client):
+        response = client.post(reverse('tus_upload_status'), '{"a": 1}', content_type='application/json')
+        assert response.status_code == 400
+
+
+class TestBatchUpload(object):
+
+    def test_many_uploads_are_created(self, client):
+        uploads = [{'length': 5, 'metadata': {'filename': 'one.txt'}}, {'length': 3}]
+        response = client.post(reverse('tus_upload_batch'), json.dumps(uploads), content_type='application/json',
+                               HTTP_TUS_RESUMABLE='1.0.0')
+        assert response.status_code == 201
+        locations = json.loads(response.content.decode())['locations']
+        assert len(locations) == 2
+
+        resource_id = locations[0].rsplit('/', 1)[-1]
+        response = client.head(reverse('tus_upload_chunks', kwargs={'resource_id': resource_id}),
+                               HTTP_TUS_RESUMABLE='1.0.0')
+        assert response['Upload-Length'] == '5'
+        assert patch_upload(client, locations[1].rsplit('/', 1)[-1], b'abc').status_code == 204
+
+    @pytest.mark.parametrize('metadata', [['filename', 'one.txt'], 'one.txt'])
+    def test_malformed_metadata_is_rejected(self, client, metadata):
+        uploads = [{'length': 5, 'metadata': metadata}]
+        response = client.post(reverse('tus_upload_batch'), json.dumps(uploads), content_type='application/json',
+                               HTTP_TUS_RESUMABLE='1.0.0')
+        assert response.status_code == 400
+
+
+class TestConcatenation(object):
+
+    def test_partial_uploads_are_concatenated(self, client, settings, finished_uploads):
+        first = create_upload(client, 6, HTTP_UPLOAD_CONCAT='partial')
+        second = create_upload(client, 5, HTTP_UPLOAD_CONCAT='partial')
+        assert patch_upload(client, second, b'world').status_code == 204
+        assert patch_upload(client, first, b'hello ').status_code == 204
+
+        response = client.head(reverse('tus_upload_chunks', kwargs={'resource_id': first}), HTTP_TUS_RESUMABLE='1.0.0')
+        assert response['Upload-Concat'] == 'partial'
+
+        response = client.post(
+            reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0',
+            HTTP_UPLOAD_CONCAT='final;/upload/{} /upload/{}'.format(first, second))
+
+        assert response.status_code == 201
+        assert finished_uploads[0]['file_size'] == 11
+        with open(os.path.join(settings.TUS_DESTINATION_DIR, finished_uploads[0]['filename']), 'rb') as f:
+            assert f.read() == b'hello world'
+
+        response = client.head(response['Location'], HTTP_TUS_RESUMABLE='1.0.0')
+        assert response.status_code == 200
+        assert response['Upload-Offset'] == '11'
+        assert response['Upload-Length'] == '11'
+        assert response['Upload-Completion'] == 'done'
+        final = response.wsgi_request.path.rsplit('/', 1)[-1]
+        assert patch_upload(client, final, b'!', offset=11).status_code == 403
+
+        response = client.head(reverse('tus_upload_chunks', kwargs={'resource_id': first}), HTTP_TUS_RESUMABLE='1.0.0')
+        assert response.status_code == 404
+
+    def test_unfinished_partial_uploads_are_rejected(self, client):
+        first = create_upload(client, 6, HTTP_UPLOAD_CONCAT='partial')
+
+        response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0',
+                               HTTP_UPLOAD_CONCAT='final;/upload/{}'.format(first))
+        assert response.status_code == 400
+
+    def test_repeated_partial_uploads_are_rejected(self, client):
+        first = create_upload(client, 5, HTTP_UPLOAD_CONCAT='partial')
+        assert patch_upload(client, first, b'hello').status_code == 204
+
+        response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0',
+                               HTTP_UPLOAD_CONCAT='final;/upload/{} /upload/{}'.format(first, first))
+        assert response.status_code == 400
+
+        response = client.head(reverse('tus_upload_chunks', kwargs={'resource_id': first}), HTTP_TUS_RESUMABLE='1.0.0')
+        assert response['Upload-Offset'] == '5'
+
+    def test_combined_size_is_checked(self, client, settings):
+        first = create_upload(client, 6, HTTP_UPLOAD_CONCAT='partial')
+        second = create_upload(client, 5, HTTP_UPLOAD_CONCAT='partial')
+        assert patch_upload(client, first, b'hello ').status_code == 204
+        assert patch_upload(client, second, b'world').status_code == 204
+        settings.TUS_MAX_FILE_SIZE = 10
+
+        response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0',
+                               HTTP_UPLOAD_CONCAT='final;/upload/{} /upload/{}'.format(first, second))
+        assert response.status_code == 413
+
+    def test_storage_without_concatenation(self, client, monkeypatch):
+        from django_tus.storage import FileSystemUploadStorage
+        monkeypatch.setattr(FileSystemUploadStorage, 'supports_concatenation', False)
+
+        response = client.options(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0')
+        assert 'concatenation' not in response['Tus-Extension'].split(',')
+
+        response = client.post(reverse('tus_upload'), HTTP_TUS_RESUMABLE='1.0.0',
+                               HTTP_UPLOAD_CONCAT='final;/upload/abc')
+        assert response.status_code == 501
+
+
+class TestChecksum(object):
+
+    def test_matching_checksum_is_accepted(self, client):
+        resource_id = create_upload(client, 5)
+        response = patch_upload(client, resource_id, b'hello',
+                                HTTP_UPLOAD_CHECKSUM='sha1 ' + base64.b64encode(hashlib.sha1(b'hello').digest()).decode())
+        assert response.status_code == 204
+
+    def test_checksum_mismatch_discards_chunk(self, client):
+        resource_id = create_upload(client, 5)
+        response = patch_upload(client, resource_id, b'hello',
+                                HTTP_UPLOAD_CHECKSUM='md5 ' + base64.b64encode(hashlib.md5(b'world').digest()).decode())
+        assert response.status_code == 460
+
+        response = client.head(reverse('tus_upload_chunks', kwargs={'resource_id': resource_id}),
+                               HTTP_TUS_RESUMABLE='1.0.0')
+        assert response['Upload-Offset'] == '0'
+
+    def test_unsupported_algorithm_is_rejected(self, client):
+        resource_id = create_upload(client, 5)
+        response = patch_upload(client, resource_id, b'hello', HTTP_UPLOAD_CHECKSUM='sha3 aGVsbG8=')
+        assert response.status_code == 400
+
+    def test_upload_digest_is_sent_with_finish_signal(self, client, settings, finished_uploads):
+        settings.TUS_UPLOAD_DIGEST = 'sha256'
+        resource_id = create_upload(client, 11)
+        patch_upload(client, resource_id, b'hello ')
+        patch_upload(client, resource_id, b'world', offset=6)
+
+        assert finished_uploads[0]['digest'] == hashlib.sha256(b'hello world').hexdigest()
+
+
+class TestDeduplication(object):
+
+    def test_duplicate_upload_is_linked_to_the_first(self, client, settings, finished_uploads):
+        settings.TUS_UPLOAD_DIGEST = 'sha256'
+        settings.TUS_DEDUPLICATE = 'hardlink'
+        for i in range(2):
+            resource_id = create_upload(client, 11)
+            patch_upload(client, resource_id, b'hello world')
+
+        first, second = (os.path.join(settings.TUS_DESTINATION_DIR, kwargs['filename']) for kwargs in finished_uploads)
+        assert finished_uploads[0]['duplicate_of'] is None
+        assert finished_uploads[1]['duplicate_of'] == finished_uploads[0]['filename']
+        assert os.path.samefile(first, second)
+        with open(second, 'rb') as f:
+            assert f.read() == b'hello world'
+        assert not os.path.exists(finished_uploads[1]['upload_file_path'])
+
+    def test_file_changed_since_is_not_linked(self, client, settings, finished_uploads):
+        settings.TUS_UPLOAD_DIGEST = 'sha256'
+        settings.TUS_DEDUPLICATE = 'hardlink'
+        resource_id = create_upload(client, 11)
+        patch_upload(client, resource_id, b'hello again')
+        first = os.path.join(settings.TUS_DESTINATION_DIR, finished_uploads[0]['filename'])
+        with open(first, 'r+b') as f:
+            f.write(b'HELLO AGAIN')
+
+        resource_id = create_upload(client, 11)
+        patch_upload(client, resource_id, b'hello again')
+
+        second = os.path.join(settings.TUS_DESTINATION_DIR, finished_uploads[1]['filename'])
+        assert finished_uploads[1]['duplicate_of'] is None
+        assert not os.path.samefile(first, second)
+        with open(second, 'rb') as f:
+            assert f.read() == b'hello again'
+
+    def test_failing_index_keeps_the_finished_upload(self, client, settings, monkeypatch, finished_uploads):
+        from django_tus.dedup import digest_index
+        settings.TUS_UPLOAD_DIGEST = 'sha256'
+        settings.TUS_DEDUPLICATE = 'hardlink'
+
+        def broken_add(digest, filename):
+            raise ConnectionError('cache is down')
+        monkeypatch.setattr(digest_index, 'add', broken_add)
+
+        resource_id = create_upload(client, 12)
+        assert patch_upload(client, resource_id, b'unique bytes').status_code == 204
+
+        with open(os.path.join(settings.TUS_DESTINATION_DIR, finished_uploads[0]['filename']), 'rb') as f:
+            assert f.read() == b'unique bytes'
+
+
+class TestAsyncUploadView(object):
+
+    def test_upload_file(self, async_client):
+        from asgiref.sync import async_to_sync
+        # The async test client takes raw header names.
+        headers = {'tus-resumable': '1.0.0'}
+
+        response = async_to_sync(async_client.post)(reverse('tus_async_upload'), **{'upload-length': '5'}, **headers)
+        assert response.status_code == 201
+        resource_id = response['Location'].rsplit('/', 1)[-1]
+        url = reverse('tus_async_upload_chunks', kwargs={'resource_id': resource_id})
+
+        response = async_to_sync(async_client.head)(url, **headers)
+        assert response['Upload-Offset'] == '0'
+
+        response = async_to_sync(async_client.generic)(
+            'PATCH', url, b'hello', content_type='application/offset+octet-stream', **{'upload-offset': '0'}, **headers)
+        assert response.status_code == 204
+        assert response['Upload-Offset'] == '5'
+
+    def test_missing_tus_header_is_rejected(self, async_client):
+        from asgiref.sync import async_to_sync
+        response = async_to_sync(async_client.get)(reverse('tus_async_upload'))
+        assert response.status_code == 405
+
+
+class TestTermination(object):
+
+    def test_delete_removes_file_and_state(self, client, settings):
+        resource_id = create_upload(client, 10)
+        url = reverse('tus_upload_chunks', kwargs={'resource_id': resource_id})
+
+        response = client.delete(url, HTTP_TUS_RESUMABLE='1.0.0')
+        assert response.status_code == 204
+        assert not os.path.exists(os.path.join(settings.TUS_UPLOAD_DIR, resource_id))
+
+        assert client.head(url, HTTP_TUS_RESUMABLE='1.0.0').status_code == 404
+        assert patch_upload(client, resource_id, b'hello').status_code == 404
+
+    def test_delete_of_locked_upload_is_not_delayed(self, client):
+        from django_tus.locks import UploadLock
+        resource_id = create_upload(client, 10)
+        url = reverse('tus_upload_chunks', kwargs={'resource_id': resource_id})
+
+        lock = UploadLock(resource_id)
+        assert lock.acquire()
+        try:
+            assert client.delete(url, HTTP_TUS_RESUMABLE='1.0.0').status_code == 204
+        finally:
+            lock.release()
+
+        assert client.head(url, HTTP_TUS_RESUMABLE='1.0.0').status_code == 404
+
+    def test_patch_racing_with_delete_fails(self, client, monkeypatch):
+        from django_tus.tusfile import TusFile
+        resource_id = create_upload(client, 10)
+        write_chunk = TusFile.write_chunk
+
+        def terminated_while_writing(self, *args, **kwargs):
+            TusFile(self.resource_id).terminate()
+            return write_chunk(self, *args, **kwargs)
+        monkeypatch.setattr(TusFile, 'write_chunk', terminated_while_writing)
+
+        assert patch_upload(client, resource_id, b'hello').status_code == 404
+
+
+@pytest.fixture
+def completion_backend(settings):
+    from django_tus import completion
+    settings.TUS_COMPLETION_BACKEND = 'django_tus.completion.ThreadPoolCompletionBackend'
+    settings.TUS_COMPLETION_RETRY_DELAY = 0
+    completion._completion_backends.clear()
+    yield completion.get_completion_backend()
+    completion._completion_backends.clear()
+
+
+def wait_for_completion(client, resource_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(reverse('tus_upload_chunks', kwargs={'resource_id': resource_id}),
+                              HTTP_TUS_RESUMABLE='1.0.0')
+        status = json.loads(response.content.decode())
+        if status['completion'] in ('done', 'failed') or time.monotonic() > deadline:
+            return status
+        time.sleep(0.01)
+
+
+class TestCompletion(object):
+
+    def test_final_patch_returns_before_completion(self, client, settings, completion_backend, finished_uploads):
+        resource_id = create_upload(client, 5, HTTP_UPLOAD_METADATA='filename {}'.format(
+            base64.b64encode(b'deferred.txt').decode()))
+        response = patch_upload(client, resource_id, b'hello')
+        assert response.status_code == 204
+        assert response['Upload-Completion'] == 'pending'
+
+        status = wait_for_completion(client, resource_id)
+
+        assert status['completion'] == 'done'
+        assert finished_uploads[0]['filename'] == status['filename']
+        head = client.head(reverse('tus_upload_chunks', kwargs={'resource_id': resource_id}),
+                           HTTP_TUS_RESUMABLE='1.0.0')
+        assert head['Upload-Completion'] == 'done'
+        os.remove(os.path.join(settings.TUS_DESTINATION_DIR, status['filename']))
+
+    def test_failed_completion_is_retried(self, client, settings, completion_backend):
+        from django_tus.signals import tus_upload_finished_signal
+        calls = []
+
+        def receiver(sender, **kwargs):
+            calls.append(kwargs['filename'])
+            if len(calls) == 1:
+                raise RuntimeError('flaky receiver')
+        tus_upload_finished_signal.connect(receiver)
+        try:
+            resource_id = create_upload(client, 5)
+            patch_upload(client, resource_id, b'hello')
+            status = wait_for_completion(client, resource_id)
+        finally:
+            tus_upload_finished_signal.disconnect(receiver)
+
+        assert status['completion'] == 'done'
+        # The file was moved only once.
+        assert calls == [status['filename'], status['filename']]
+        os.remove(os.path.join(settings.TUS_DESTINATION_DIR, status['filename']))
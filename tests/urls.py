@@ -2,11 +2,15 @@ from django.conf import settings
 from django.conf.urls import url
 from django.conf.urls.static import static
 
-from django_tus.views import TusUpload
+from django_tus.views import AsyncTusUpload, TusBatchUpload, TusUpload, TusUploadStatus
 
 urlpatterns = [
     url(r'^upload/$', TusUpload.as_view(), name='tus_upload'),
+    url(r'^upload/status$', TusUploadStatus.as_view(), name='tus_upload_status'),
+    url(r'^upload/batch$', TusBatchUpload.as_view(), name='tus_upload_batch'),
     url(r'^upload/(?P<resource_id>[0-9a-z-]+)$', TusUpload.as_view(), name='tus_upload_chunks'),
+    url(r'^async-upload/$', AsyncTusUpload.as_view(), name='tus_async_upload'),
+    url(r'^async-upload/(?P<resource_id>[0-9a-z-]+)$', AsyncTusUpload.as_view(), name='tus_async_upload_chunks'),
 ]
 
 urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)